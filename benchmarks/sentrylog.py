@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# ---------------------------------------------------------------------
+# benchmarks.sentrylog
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-20
+
+'''Measure the cost of logging errors with `xoeuf.sentrylog`:mod:.
+
+Runs a local stand-in of Sentry (see ``sentry_standin.py``) and logs errors
+(with a traceback) at 10, 100 and 1000 errors per second with the "sync",
+"threaded" and "queued" transports.  No DB nor network is needed, though
+Odoo must be importable.
+
+Usage::
+
+  $ python benchmarks/sentrylog.py --duration 5 --delay 0.02 \\
+        --output sentrylog.json
+
+The output is a JSON list with an item per transport and rate with keys
+'transport', 'rate', 'logged', 'p50', 'p90', 'p99' and 'max' (milliseconds
+added to the logging thread per error), 'delivered' (events received by
+the stand-in) and 'dropped' (records dropped by the queue of the "queued"
+transport).  A summary is printed to the standard error.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import sys
+import json
+import time
+import logging
+from timeit import default_timer as timer
+
+from sentry_standin import StandIn
+
+TRANSPORTS = ('sync', 'threaded', 'queued')
+RATES = (10, 100, 1000)
+
+
+def get_arg_parser():
+    from argparse import ArgumentParser
+    res = ArgumentParser(description='Benchmark xoeuf.sentrylog')
+    res.add_argument('--duration', dest='duration',
+                     default=5, type=float,
+                     help='Seconds logging errors per scenario.  Defaults '
+                     'to 5.')
+    res.add_argument('--delay', dest='delay',
+                     default=0.02, type=float,
+                     help='Seconds the stand-in takes to answer each '
+                     'event.  Defaults to 0.02.')
+    res.add_argument('--queue-size', dest='queue_size',
+                     default=1000, type=int,
+                     help='The size of the queue of the "queued" '
+                     'transport.  Defaults to 1000.')
+    res.add_argument('-o', '--output', dest='output', default=None,
+                     help='Write the JSON results to this file instead of '
+                     'the standard output.')
+    return res
+
+
+def setup(transport, dsn, queue_size):
+    '''Patch the logging to use a new client with the `transport`.'''
+    from xoeuf import _sentrylog
+    _sentrylog._sentry_client = None
+    _sentrylog._records_queue = None
+    _sentrylog._limiter = None
+    _sentrylog.conf.clear()
+    _sentrylog.conf.update({
+        'dsn': dsn,
+        'transport': transport,
+        'sentrylog.queue-size': queue_size,
+    })
+    _sentrylog.patch_logging(force=True)
+    return _sentrylog
+
+
+def percentile(values, q):
+    return values[int(round(q * (len(values) - 1)))]
+
+
+def log_errors(logger, rate, duration):
+    '''Log `rate` errors per second during `duration` seconds.
+
+    Return the sorted list of the timings (milliseconds) of each call.
+
+    '''
+    timings = []
+    count = int(rate * duration)
+    start = time.time()
+    for i in range(count):
+        pause = start + i / rate - time.time()
+        if pause > 0:
+            time.sleep(pause)
+        try:
+            raise ValueError('Benchmark error %d' % i)
+        except ValueError:
+            began = timer()
+            logger.exception('Benchmark error')
+            timings.append((timer() - began) * 1000)
+    timings.sort()
+    return timings
+
+
+def run_scenario(standin, transport, rate, options):
+    sentrylog = setup(transport, standin.dsn(), options.queue_size)
+    standin.reset()
+    logger = logging.getLogger('xoeuf.benchmarks.sentrylog')
+    timings = log_errors(logger, rate, options.duration)
+    queue = sentrylog._records_queue
+    if queue is not None:
+        queue.flush(60)
+    delivered = standin.wait_idle()
+    return dict(transport=transport,
+                rate=rate,
+                logged=len(timings),
+                p50=percentile(timings, 0.5),
+                p90=percentile(timings, 0.9),
+                p99=percentile(timings, 0.99),
+                max=timings[-1],
+                delivered=delivered,
+                dropped=queue.dropped if queue is not None else 0)
+
+
+def main(args=None):
+    parser = get_arg_parser()
+    options = parser.parse_args(args)
+    standin = StandIn(delay=options.delay)
+    standin.start()
+    results = []
+    for transport in TRANSPORTS:
+        for rate in RATES:
+            item = run_scenario(standin, transport, rate, options)
+            results.append(item)
+            print('%(transport)8s %(rate)5d/s  p50=%(p50).3f '
+                  'p90=%(p90).3f p99=%(p99).3f max=%(max).3f '
+                  'logged=%(logged)d delivered=%(delivered)d '
+                  'dropped=%(dropped)d' % item,
+                  file=sys.stderr)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# ---------------------------------------------------------------------
+# benchmarks.signals
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-20
+
+'''Measure the overhead of `xoeuf.signals`:mod: in create/write/unlink.
+
+Runs the operations on a transient model of the addon 'test_localized_dt'
+(in ``tests/addons``) with 0, 10, 100 and 500 no-op receivers connected to
+`pre_save` and `post_save`, for receivers of any sender, of the model and of
+another model; with and without `require_registry`.  Each scenario runs in
+a transaction that is rolled back.
+
+Usage::
+
+  $ python benchmarks/signals.py -d DB --addons-path=...,tests/addons \\
+        --output signals.json
+
+The DB must have the addon 'test_localized_dt' installed.  Arguments not
+recognized are passed to Odoo's configuration (e.g ``--db_host``).
+
+The output is a JSON list with an item per scenario and operation with
+keys 'operation', 'receivers', 'sender', 'require_registry', 'iterations',
+'p50', 'p90', 'p99' and 'max' (milliseconds) and 'queries' (SQL queries per
+operation).  A summary is printed to the standard error.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import sys
+import json
+from timeit import default_timer as timer
+
+RECEIVERS = (0, 10, 100, 500)
+SENDERS = ('any', 'model', 'other')
+OPERATIONS = ('create', 'write', 'unlink')
+
+
+def get_arg_parser():
+    from argparse import ArgumentParser
+    res = ArgumentParser(description='Benchmark xoeuf.signals')
+    res.add_argument('-d', '--database', dest='database', required=True)
+    res.add_argument('-n', '--iterations', dest='iterations',
+                     default=200, type=int,
+                     help='Operations per scenario.  Defaults to 200.')
+    res.add_argument('-o', '--output', dest='output', default=None,
+                     help='Write the JSON results to this file instead of '
+                     'the standard output.')
+    return res
+
+
+def get_registry(database):
+    try:
+        from odoo.modules.registry import Registry
+        get = Registry
+    except ImportError:
+        from openerp.modules.registry import RegistryManager
+        get = RegistryManager.get
+    return get(database)
+
+
+def get_model_names(env):
+    for prefix in ('odoo', 'openerp'):
+        name = '%s.addons.test_localized_dt.a' % prefix
+        if name in env.registry:
+            return name, '%s.addons.test_localized_dt.b' % prefix
+    raise LookupError('The addon test_localized_dt is not installed')
+
+
+def make_receiver():
+    def receiver(sender, **kwargs):
+        pass
+    return receiver
+
+
+def connect(count, sender, require_registry):
+    '''Connect `count` new receivers to the save signals.
+
+    Return the list of connected receivers.
+
+    '''
+    from xoeuf.signals import pre_save, post_save
+    receivers = [make_receiver() for _ in range(count)]
+    for signal in pre_save + post_save:
+        for receiver in receivers:
+            signal.connect(receiver, sender=sender,
+                           require_registry=require_registry)
+    return receivers
+
+
+def disconnect(receivers, sender):
+    from xoeuf.signals import pre_save, post_save
+    for signal in pre_save + post_save:
+        for receiver in receivers:
+            signal.disconnect(receiver, sender=sender)
+
+
+def percentile(values, q):
+    return values[int(round(q * (len(values) - 1)))]
+
+
+def measure(model, iterations):
+    '''Run the operations and return {operation: (timings, queries)}.'''
+    cr = model.env.cr
+    result = {op: ([], 0) for op in OPERATIONS}
+
+    def timed(op, func, *args):
+        queries = cr.sql_log_count
+        start = timer()
+        res = func(*args)
+        elapsed = timer() - start
+        timings, count = result[op]
+        timings.append(elapsed * 1000)
+        result[op] = (timings, count + cr.sql_log_count - queries)
+        return res
+
+    for i in range(iterations):
+        record = timed('create', model.create, {'dt': '2017-01-01 00:00:00'})
+        timed('write', record.write, {'dt': '2017-01-02 00:00:00'})
+        timed('unlink', record.unlink)
+    return result
+
+
+def run_scenario(registry, count, sender, require_registry, iterations):
+    try:
+        from odoo import api, SUPERUSER_ID
+    except ImportError:
+        from openerp import api, SUPERUSER_ID
+    with api.Environment.manage():
+        cr = registry.cursor()
+        try:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            model_name, other_name = get_model_names(env)
+            senderkey = {'any': None,
+                         'model': model_name,
+                         'other': other_name}[sender]
+            receivers = connect(count, senderkey, require_registry)
+            try:
+                measured = measure(env[model_name], iterations)
+            finally:
+                disconnect(receivers, senderkey)
+        finally:
+            cr.rollback()
+            cr.close()
+    for op in OPERATIONS:
+        timings, queries = measured[op]
+        timings.sort()
+        yield dict(operation=op,
+                   receivers=count,
+                   sender=sender,
+                   require_registry=require_registry,
+                   iterations=iterations,
+                   p50=percentile(timings, 0.5),
+                   p90=percentile(timings, 0.9),
+                   p99=percentile(timings, 0.99),
+                   max=timings[-1],
+                   queries=queries / iterations)
+
+
+def main(args=None):
+    try:
+        from odoo.tools import config
+    except ImportError:
+        from openerp.tools import config
+    import xoeuf.signals  # noqa: Make sure signals are in place.
+    parser = get_arg_parser()
+    options, odoo_args = parser.parse_known_args(args)
+    config.parse_config(odoo_args)
+    registry = get_registry(options.database)
+    results = []
+    for count in RECEIVERS:
+        for sender in SENDERS if count else SENDERS[:1]:
+            for require_registry in (True, False):
+                for item in run_scenario(registry, count, sender,
+                                         require_registry,
+                                         options.iterations):
+                    results.append(item)
+                    print('%(operation)6s %(receivers)4d %(sender)6s '
+                          '%(require_registry)5s  p50=%(p50).3f '
+                          'p90=%(p90).3f p99=%(p99).3f max=%(max).3f '
+                          'queries=%(queries).1f' % item,
+                          file=sys.stderr)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
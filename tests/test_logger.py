@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------
+# test_logger
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-27
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import json
+import logging
+
+from xoeuf.tools.logger import JSONFormatter
+
+
+def make_record(msg, args=None, exc_info=None):
+    return logging.LogRecord('openerp.x', logging.ERROR, __file__, 1, msg,
+                             args, exc_info)
+
+
+def test_json_formatter():
+    try:
+        raise ValueError('Boom')
+    except ValueError:
+        import sys
+        record = make_record('Failed %s', ('here', ), sys.exc_info())
+    record.dbname = 'db'
+    result = json.loads(JSONFormatter().format(record))
+    assert result['level'] == 'ERROR'
+    assert result['logger'] == 'openerp.x'
+    assert result['message'] == 'Failed here'
+    assert result['dbname'] == 'db'
+    assert 'uid' not in result
+    assert 'ValueError: Boom' in result['exc']
+
+
+def test_json_formatter_with_non_utf8_bytes():
+    # Only the values which are not UTF-8 are altered.
+    record = make_record(b'Caf\xe9 %s', (b'cr\xc3\xa8me', ))
+    result = json.loads(JSONFormatter().format(record))
+    assert result['level'] == 'ERROR'
+    assert result['logger'] == 'openerp.x'
+    assert 'Caf' in result['message']
+    if str is bytes:
+        # Python 2
+        assert result['message'] == u'Caf\ufffd cr\xe8me'
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------
+# test_sentrylog
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-26
+
+'''Tests of the pieces of `xoeuf.sentrylog` which need neither a DB nor a
+Sentry.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import os
+import json
+import logging
+import subprocess
+import sys
+
+import pytest
+
+from xoeuf import _sentrylog
+from xoeuf._sentrylog import SpoolTransport, replay_spool
+
+
+def make_record(message='Boom', level=logging.ERROR):
+    return logging.LogRecord('xoeuf.tests', level, __file__, 1, message,
+                             None, None)
+
+
+# _RecordsQueue
+def make_queue(policy):
+    # The thread won't take the records until flushed.
+    return _sentrylog._RecordsQueue(maxsize=2, policy=policy,
+                                    batch_size=10, interval=3600)
+
+
+def test_queue_drops_the_newest_records():
+    sent = []
+    queue = make_queue('newest')
+    assert queue.put(sent.append, 1)
+    assert queue.put(sent.append, 2)
+    assert not queue.put(sent.append, 3)
+    assert queue.dropped == 1
+    assert queue.flush(5)
+    assert sent == [1, 2]
+    assert queue.sent == 2
+
+
+def test_queue_drops_the_oldest_records():
+    sent = []
+    queue = make_queue('oldest')
+    assert queue.put(sent.append, 1)
+    assert queue.put(sent.append, 2)
+    assert queue.put(sent.append, 3)
+    assert queue.dropped == 1
+    assert queue.flush(5)
+    assert sent == [2, 3]
+
+
+def test_queue_rejects_unknown_policies():
+    with pytest.raises(ValueError):
+        _sentrylog._RecordsQueue(policy='random')
+
+
+def test_queue_survives_failing_sends():
+    def fail(record):
+        raise RuntimeError
+
+    sent = []
+    queue = make_queue('newest')
+    queue.put(fail, 1)
+    queue.put(sent.append, 2)
+    assert queue.flush(5)
+    assert sent == [2]
+
+
+# _FingerprintLimiter
+def test_limiter_allows_a_burst_per_key():
+    limiter = _sentrylog._FingerprintLimiter(rate=0, burst=2, interval=3600)
+    record = make_record()
+    assert limiter.allow(('a', ), record)
+    assert limiter.allow(('a', ), record)
+    assert not limiter.allow(('a', ), record)
+    assert not limiter.allow(('a', ), record)
+    assert limiter.allow(('b', ), record)
+    assert limiter.pop_summaries() == [
+        (('a', ), 2, (logging.ERROR, 'xoeuf.tests', 'Boom'))
+    ]
+    assert limiter.pop_summaries() == []
+
+
+def test_limiter_refills_the_buckets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(_sentrylog, '_time', lambda: now[0])
+    limiter = _sentrylog._FingerprintLimiter(rate=1, burst=1, interval=3600)
+    record = make_record()
+    assert limiter.allow('a', record)
+    assert not limiter.allow('a', record)
+    now[0] += 0.5
+    assert not limiter.allow('a', record)
+    now[0] += 0.5
+    assert limiter.allow('a', record)
+    # Full buckets are forgotten.
+    now[0] += 10
+    limiter.pop_summaries()
+    assert limiter.buckets == {}
+
+
+def test_limiter_reports_summaries_on_flush():
+    reported = []
+    limiter = _sentrylog._FingerprintLimiter(rate=0, burst=0, interval=3600,
+                                             report=reported.append)
+    limiter.allow('a', make_record('First'))
+    limiter.allow('a', make_record('Second'))
+    limiter.flush()
+    assert reported == [('a', 2, (logging.ERROR, 'xoeuf.tests', 'First'))]
+    limiter.flush()
+    assert len(reported) == 1
+
+
+# SpoolTransport and replay_spool
+class Recorder(object):
+    def __init__(self, fail_after=None):
+        self.events = []
+        self.fail_after = fail_after
+
+    def send(self, url, data, headers):
+        if self.fail_after is not None and \
+                len(self.events) >= self.fail_after:
+            raise IOError('Sentry is down')
+        self.events.append((url, data, headers))
+
+
+def spool(directory, count):
+    transport = SpoolTransport()
+    transport.directory = directory
+    for i in range(count):
+        transport.send('http://sentry/api/1/store/',
+                       ('event %d' % i).encode('ascii'),
+                       {'X-Sentry-Auth': 'auth'})
+    transport.close()
+
+
+def test_replay_spool_round_trip(tmpdir):
+    directory = str(tmpdir)
+    spool(directory, 3)
+    assert [name.endswith('.spool') for name in os.listdir(directory)] == [
+        True
+    ]
+    recorder = Recorder()
+    assert replay_spool(directory, transport=recorder) == (3, 0)
+    assert recorder.events == [
+        ('http://sentry/api/1/store/', ('event %d' % i).encode('ascii'),
+         {'X-Sentry-Auth': 'auth'})
+        for i in range(3)
+    ]
+    assert os.listdir(directory) == []
+    assert replay_spool(directory, transport=recorder) == (0, 0)
+
+
+def test_spool_with_the_transport_api_of_old_ravens(tmpdir):
+    # Raven < 6 gives the URL to the constructor.
+    from xoeuf._sentrylog import _urlparse
+    url = 'http://sentry/api/1/store/'
+    transport = SpoolTransport(_urlparse.urlparse(url))
+    transport.directory = str(tmpdir)
+    transport.send(b'event', {'X-Sentry-Auth': 'auth'})
+    transport.close()
+    recorder = Recorder()
+    assert replay_spool(str(tmpdir), transport=recorder) == (1, 0)
+    assert recorder.events == [(url, b'event', {'X-Sentry-Auth': 'auth'})]
+
+
+def test_replay_spool_to_another_url(tmpdir):
+    directory = str(tmpdir)
+    spool(directory, 1)
+    recorder = Recorder()
+    assert replay_spool(directory, url='http://localhost:9000',
+                        transport=recorder) == (1, 0)
+    assert recorder.events[0][0] == 'http://localhost:9000'
+
+
+def test_replay_spool_keeps_the_events_not_sent(tmpdir):
+    directory = str(tmpdir)
+    spool(directory, 3)
+    assert replay_spool(directory, transport=Recorder(fail_after=1)) == (1, 2)
+    recorder = Recorder()
+    assert replay_spool(directory, transport=recorder) == (2, 0)
+    assert [data for _, data, _ in recorder.events] == [b'event 1',
+                                                        b'event 2']
+    assert os.listdir(directory) == []
+
+
+def test_replay_spool_skips_files_of_running_processes(tmpdir):
+    directory = str(tmpdir)
+    transport = SpoolTransport()
+    transport.directory = directory
+    transport.send('http://sentry', b'event', {})
+    try:
+        assert replay_spool(directory, transport=Recorder()) == (0, 0)
+    finally:
+        transport.close()
+    assert replay_spool(directory, transport=Recorder()) == (1, 0)
+
+
+def test_replay_spool_reclaims_files_of_dead_processes(tmpdir):
+    directory = str(tmpdir)
+    spool(directory, 2)
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    dead = process.pid
+    filename, = os.listdir(directory)
+    base = os.path.splitext(filename)[0]
+    # A file being written and another being replayed by dead processes.
+    os.rename(os.path.join(directory, filename),
+              os.path.join(directory, '%d-0-dead.part' % dead))
+    spool(directory, 1)
+    filename, = [name for name in os.listdir(directory)
+                 if name.endswith('.spool')]
+    os.rename(os.path.join(directory, filename),
+              os.path.join(directory, '%s.replaying-%d' % (base, dead)))
+    assert replay_spool(directory, transport=Recorder()) == (3, 0)
+    assert os.listdir(directory) == []
+
+
+def test_replay_spool_ignores_a_missing_directory(tmpdir):
+    directory = os.path.join(str(tmpdir), 'missing')
+    assert replay_spool(directory, transport=Recorder()) == (0, 0)
+
+
+# Slow operations
+class Request(object):
+    def __init__(self, path):
+        self.httprequest = type('HTTPRequest', (object, ), {'path': path})
+        self.params = {'model': 'res.partner', 'method': 'read'}
+
+
+def test_longpolling_requests_are_not_timed(monkeypatch):
+    assert _sentrylog._is_excluded_request(Request('/longpolling/poll'))
+    assert not _sentrylog._is_excluded_request(Request('/web/dataset/call'))
+    assert not _sentrylog._is_excluded_request(object())
+    assert _sentrylog._get_rpc_name(Request('/web/dataset/call')) == \
+        '/web/dataset/call (res.partner.read)'
+    monkeypatch.setattr(_sentrylog, '_slow_excluded_paths', ())
+    assert not _sentrylog._is_excluded_request(Request('/longpolling/poll'))
+
+
+# _cap and _cap_event
+@pytest.fixture
+def field_size(monkeypatch):
+    monkeypatch.setattr(_sentrylog, '_max_field_size', 10)
+
+
+def test_cap_truncates_strings(field_size):
+    budget = [1000]
+    assert _sentrylog._cap('x' * 20, budget) == 'x' * 10 + '...'
+    assert budget[0] == 1000 - len(json.dumps('x' * 10 + '...'))
+    assert _sentrylog._cap(b'x' * 20, [1000]) == b'x' * 10 + b'...'
+    assert _sentrylog._cap('short', [1000]) == 'short'
+
+
+def test_cap_replaces_objects_by_their_repr(field_size):
+    class Upload(object):
+        def __repr__(self):
+            return '<Upload of a huge file>'
+
+    class Broken(object):
+        def __repr__(self):
+            raise RuntimeError
+
+    value = _sentrylog._cap({'file': Upload(), 'other': Broken()}, [1000])
+    assert value['file'] == '<Upload of...'
+    assert value['other'].startswith('<')
+    assert _sentrylog._cap((1, None, True), [1000]) == [1, None, True]
+
+
+def test_cap_drops_items_beyond_the_budget(field_size):
+    value = {'items': ['x' * 10] * 1000}
+    budget = [100]
+    result = _sentrylog._cap(value, budget)
+    items = result['items']
+    assert 1 < len(items) < 10
+    assert items[-1] == _sentrylog._TRUNCATED
+    assert len(json.dumps(result)) <= 100 + len(json.dumps('x' * 10)) + 10
+    assert budget[0] <= 0
+    result = _sentrylog._cap({str(i): i for i in range(100)}, [50])
+    assert len(result) < 10
+    assert result[_sentrylog._TRUNCATED] == _sentrylog._TRUNCATED
+
+
+def test_size_is_not_below_the_json_size():
+    for value in ('', 'abc', [], {}, [1, 'a', None], {'a': [1, {'b': 'c'}]},
+                  {'key': 'value', 'other': ['x'] * 10}):
+        assert _sentrylog._size(value) >= len(json.dumps(value))
+
+
+def test_cap_event():
+    frames = [
+        {'function': 'f%d' % i, 'vars': {'value': 'x' * 1000}}
+        for i in range(10)
+    ]
+    data = {
+        'message': 'Boom',
+        'exception': {'values': [{'stacktrace': {'frames': frames}}]},
+        'request': {'data': 'x' * 1000},
+        'extra': {'key%d' % i: 'x' * 100 for i in range(100)},
+        'breadcrumbs': {'values': [{'message': 'q%d' % i}
+                                   for i in range(100)]},
+    }
+    _sentrylog._cap_event(data, 5000)
+    assert len(json.dumps(data)) <= 5000
+    assert data['message'] == 'Boom'
+    assert data['request'] == {'data': 'x' * 1000}
+    # The locals of the innermost frames are kept.
+    kept = [frame['function'] for frame in frames if 'vars' in frame]
+    assert kept == ['f7', 'f8', 'f9']
+    assert len(frames) == 10
+    assert isinstance(data['extra'], dict)
+    # No room left for the breadcrumbs.
+    assert data['breadcrumbs']['values'] == []
+
+
+def test_cap_event_keeps_the_newest_breadcrumbs():
+    data = {
+        'message': 'Boom',
+        'breadcrumbs': {'values': [{'message': 'q%d' % i}
+                                   for i in range(100)]},
+    }
+    _sentrylog._cap_event(data, 500)
+    values = data['breadcrumbs']['values']
+    assert 0 < len(values) < 100
+    assert values[-1] == {'message': 'q99'}
+    assert len(json.dumps(data)) <= 500
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------
+# test_signals
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-26
+
+'''Tests of the dispatch of signals.  No DB is needed.
+
+Senders are plain model names, so receivers are connected with
+``require_registry=False``.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import gc
+import json
+
+import pytest
+
+from xoeuf import _signals_impl as impl
+from xoeuf._signals_impl import Signal, Receiver
+
+
+ACTION = 'xoeuf.tests.signals'
+
+
+def receivers(signal, sender, values=None):
+    return [r.receiver for r in signal._live_receivers(sender, values)]
+
+
+def make_receiver(name):
+    def receiver(sender, **kwargs):
+        return name
+    receiver.__name__ = str(name)
+    return receiver
+
+
+@pytest.fixture
+def signal():
+    result = Signal(ACTION)
+    yield result
+    for receiver in list(result.receivers.values()):
+        result.disconnect(receiver.receiver, receiver.senderkey)
+
+
+def connect(signal, receiver, sender=None, **kwargs):
+    signal.connect(receiver, sender=sender, require_registry=False, **kwargs)
+
+
+def test_dispatch_keeps_connection_order(signal):
+    first, second, third = map(make_receiver, ('first', 'second', 'third'))
+    connect(signal, first)
+    connect(signal, second, 'a.model')
+    connect(signal, third)
+    assert receivers(signal, 'a.model') == [first, second, third]
+    assert receivers(signal, 'another.model') == [first, third]
+    assert receivers(signal, None) == [first, third]
+    assert signal.send('a.model') == [(first, 'first'), (second, 'second'),
+                                      (third, 'third')]
+
+
+def test_dispatch_with_several_senders(signal):
+    first, second = make_receiver('first'), make_receiver('second')
+    connect(signal, first, ['a.model', 'b.model'])
+    connect(signal, second, 'b.model')
+    assert receivers(signal, 'a.model') == [first]
+    assert receivers(signal, 'b.model') == [first, second]
+    assert receivers(signal, 'c.model') == []
+
+
+def test_connect_twice_is_ignored(signal):
+    first = make_receiver('first')
+    connect(signal, first, 'a.model')
+    connect(signal, first, 'a.model')
+    assert receivers(signal, 'a.model') == [first]
+
+
+def test_disconnect_prunes_the_dispatch(signal):
+    first, second, third = map(make_receiver, ('first', 'second', 'third'))
+    connect(signal, first)
+    connect(signal, second, 'a.model')
+    connect(signal, third)
+    signal.disconnect(second, 'a.model')
+    assert receivers(signal, 'a.model') == [first, third]
+    # The bucket of 'a.model' only had receivers for any sender.
+    assert 'a.model' not in signal._dispatch
+    signal.disconnect(first)
+    assert receivers(signal, 'a.model') == [third]
+    signal.disconnect(third)
+    assert signal._dispatch == {}
+    assert not signal.has_listeners('a.model')
+
+
+def test_disconnect_any_sender_keeps_specific_buckets(signal):
+    first, second = make_receiver('first'), make_receiver('second')
+    connect(signal, first)
+    connect(signal, second, 'a.model')
+    signal.disconnect(first)
+    assert receivers(signal, 'a.model') == [second]
+    assert receivers(signal, 'another.model') == []
+
+
+def test_senders_are_tracked_per_action(signal):
+    class Model(object):
+        _name = 'a.model'
+
+    first = make_receiver('first')
+    assert not impl._has_receivers(ACTION, Model)
+    generation = impl._generations.get(ACTION)
+    connect(signal, first, 'a.model')
+    assert impl._has_receivers(ACTION, Model)
+    assert impl._generations.get(ACTION) != generation
+    signal.disconnect(first, 'a.model')
+    assert not impl._has_receivers(ACTION, Model)
+
+
+def test_strong_receivers_are_kept_alive(signal):
+    connect(signal, make_receiver('lambda'), 'a.model')
+    gc.collect()
+    assert [r.__name__ for r in receivers(signal, 'a.model')] == ['lambda']
+
+
+def test_weak_receivers_are_pruned(signal):
+    first = make_receiver('first')
+    connect(signal, first, 'a.model')
+    connect(signal, make_receiver('weak'), 'a.model', weak=True)
+    gc.collect()
+    assert receivers(signal, 'a.model') == [first]
+    assert len(signal.receivers) == 1
+    assert signal._dispatch['a.model'] == (first, )
+
+
+def test_safe_send_to_concurrent_receivers(signal):
+    import threading
+
+    def pooled(sender, **kwargs):
+        return threading.current_thread().name
+
+    def failing(sender, **kwargs):
+        raise RuntimeError('failed')
+
+    first = make_receiver('first')
+    connect(signal, first, 'a.model')
+    connect(signal, pooled, 'a.model', concurrent=True)
+    connect(signal, failing, 'a.model', concurrent=True)
+    for _ in range(20):
+        responses = signal.safe_send('a.model')
+        assert [r.receiver for r, _ in responses] == [first, pooled, failing]
+        assert responses[0][1] == 'first'
+        assert responses[1][1].startswith('xoeuf.signals.concurrent')
+        assert isinstance(responses[2][1], RuntimeError)
+
+
+def test_concurrent_receivers_are_rejected_within_transactions():
+    with pytest.raises(ValueError):
+        impl.post_write.connect(make_receiver('first'), concurrent=True)
+    assert not impl.post_write.receivers
+
+
+def test_cacheable_receivers_are_only_for_fields_view_get(signal):
+    with pytest.raises(ValueError):
+        connect(signal, make_receiver('first'), cacheable=True)
+    assert not signal.receivers
+
+
+def test_filtered_domain_needs_records_to_filter():
+    handler = impl.filtered_domain([('state', '=', 'done')])(
+        make_receiver('first')
+    )
+    for signal in (impl.pre_create, impl.post_unlink,
+                   impl.post_commit_unlink, impl.outbox_unlink,
+                   impl.remote_post_save, impl.pre_fields_view_get):
+        with pytest.raises(ValueError):
+            signal.connect(handler, require_registry=False)
+        assert not signal.receivers
+    # Other filters keep the domain.
+    handler = impl.filtered(lambda self, **kwargs: True)(handler)
+    with pytest.raises(ValueError):
+        impl.pre_create.connect(handler, require_registry=False)
+    impl.post_create.connect(handler, require_registry=False)
+    try:
+        # A non-recordset sender is not filtered.
+        assert impl.post_create.send('a.model') == [(handler, 'first')]
+    finally:
+        impl.post_create.disconnect(handler)
+
+
+@pytest.fixture
+def post_write():
+    receiver = make_receiver('post_write')
+    connect(impl.post_write, receiver, ['a.model', 'b.model'])
+    yield impl.post_write
+    impl.post_write.disconnect(receiver, ['a.model', 'b.model'])
+
+
+def test_suppressed_signal_groups(post_write):
+    assert post_write.send('a.model')
+    with impl.suppressed(impl.post_save):
+        assert post_write.send('a.model') == []
+        assert post_write.safe_send('a.model') == []
+    with impl.suppressed(impl.pre_save, impl.post_commit_save):
+        assert post_write.send('a.model')
+    with impl.suppressed():
+        assert post_write.send('a.model') == []
+    assert post_write.send('a.model')
+
+
+def test_suppressed_by_model(post_write):
+    with impl.suppressed(post_write, models='a.model'):
+        assert post_write.send('a.model') == []
+        assert post_write.send('b.model')
+    with impl.suppressed(models=['a.model', 'b.model']):
+        assert post_write.send('a.model') == []
+        assert post_write.send('b.model') == []
+
+
+def test_suppressed_collects_the_ids(post_write):
+    collected = []
+    with impl.suppressed(impl.post_save, callback=collected.append) as ids:
+        post_write.send('a.model', ids=[1, 2])
+        post_write.send('a.model', ids=[3])
+        with impl.suppressed(models='b.model'):
+            # The innermost block suppresses these.
+            post_write.send('b.model', ids=[4])
+    assert collected == [ids]
+    assert ids == {post_write: {'a.model': {1, 2, 3}}}
+
+
+@pytest.fixture
+def instrumented():
+    impl.reset_receivers_stats()
+    impl.instrument_receivers(True)
+    yield
+    impl.instrument_receivers(False)
+    impl.reset_receivers_stats()
+
+
+def test_instrumented_receivers(signal, instrumented):
+    first = make_receiver('first')
+    connect(signal, first)
+    assert signal.send('a.model') == [(first, 'first')]
+    assert signal.send('a.model') == [(first, 'first')]
+    stats, = [item for item in impl.get_receivers_stats()
+              if item['receiver'].endswith('first')]
+    assert stats['sender'] == 'a.model'
+    assert stats['calls'] == 2
+    assert 'a.model' in impl.receivers_report()
+
+
+def test_instrumented_receivers_with_unhashable_senders(signal,
+                                                        instrumented):
+    def failing(sender, **kwargs):
+        raise RuntimeError('failed')
+
+    first = make_receiver('first')
+    connect(signal, first)
+    assert signal.send(['a.model']) == [(first, 'first')]
+    stats, = impl.get_receivers_stats()
+    assert stats['sender'] is None
+    connect(signal, failing)
+    # The error of the receiver is not masked.
+    with pytest.raises(RuntimeError):
+        signal.send(['a.model'])
+
+
+def test_interested():
+    def interested(fields, values):
+        receiver = Receiver(make_receiver('first'), fields=fields)
+        return impl._interested(receiver, values)
+
+    assert interested(None, {'state': 'done'})
+    assert interested(['state', 'name'], {'state': 'done'})
+    assert not interested(['state', 'name'], {'partner_id': 1})
+    assert interested(['state'], None)
+    assert interested(['state'], ['state'])
+    # A single name is not taken as a sequence of characters.
+    assert interested('state', {'state': 'done'})
+    assert not interested('state', {'s': 1, 't': 2})
+
+
+def test_send_filters_by_fields(signal):
+    first, second = make_receiver('first'), make_receiver('second')
+    connect(signal, first, 'a.model', fields=['state'])
+    connect(signal, second, 'a.model')
+    assert receivers(signal, 'a.model', {'name': 'x'}) == [second]
+    assert receivers(signal, 'a.model', {'state': 'x'}) == [first, second]
+    assert receivers(signal, 'a.model') == [first, second]
+    assert signal.send('a.model', values={'name': 'x'}) == [
+        (second, 'second')
+    ]
+
+
+def test_safe_send_catches_errors(signal):
+    def failing(sender, **kwargs):
+        raise RuntimeError('failed')
+
+    second = make_receiver('second')
+    connect(signal, failing, 'a.model')
+    connect(signal, second, 'a.model')
+    (_, error), (_, response) = signal.safe_send('a.model')
+    assert isinstance(error, RuntimeError)
+    assert response == 'second'
+    with pytest.raises(RuntimeError):
+        signal.safe_send('a.model', thrown=RuntimeError)
+
+
+class NotifyCursor(object):
+    def __init__(self):
+        self.payloads = []
+
+    def execute(self, query, params):
+        channel, payload = params
+        assert channel == impl.REMOTE_CHANNEL
+        assert len(payload) < 8000
+        self.payloads.append(json.loads(payload))
+
+
+def notify_remote(ids, fields):
+    cr = NotifyCursor()
+    hooks = impl._TransactionHooks()
+    hooks.remote = {('a.model', 'write'): (set(ids), set(fields))}
+    impl._notify_remote(cr, hooks)
+    assert hooks.remote is None
+    assert sorted(i for p in cr.payloads for i in p['ids']) == sorted(ids)
+    return cr.payloads
+
+
+def test_notify_remote_splits_the_ids():
+    payloads = notify_remote(range(5000), ['state'])
+    assert 1 < len(payloads) < 10
+    assert all(p['fields'] == ['state'] for p in payloads)
+    assert all(p['model'] == 'a.model' for p in payloads)
+    assert all(p['action'] == 'write' for p in payloads)
+
+
+def test_notify_remote_drops_too_many_fields():
+    fields = ['x_field_%04d' % i for i in range(1000)]
+    payloads = notify_remote(range(5000), fields)
+    assert len(payloads) < 10
+    assert all(p['fields'] is None for p in payloads)
+    payloads = notify_remote([1], fields)
+    assert [(p['ids'], p['fields']) for p in payloads] == [([1], None)]
+
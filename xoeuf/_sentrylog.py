@@ -26,7 +26,18 @@ from __future__ import (division as _py3_division,
                         print_function as _py3_print,
                         absolute_import as _py3_abs_import)
 
+import os
+import json
+import base64
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import time as _time
+
 import raven
+from raven.transport.base import Transport
 from raven.transport.http import HTTPTransport
 from raven.transport.threaded import ThreadedHTTPTransport
 from raven.transport.gevent import GeventedHTTPTransport
@@ -38,6 +49,16 @@ try:
 except ImportError:
     import urllib.parse as _urlparse
 
+try:
+    from inspect import getfullargspec as _getargspec
+except ImportError:
+    from inspect import getargspec as _getargspec
+
+# Raven < 6 binds the transports to the URL of the store endpoint: they are
+# created with the parsed URL and their `send` takes only the data and the
+# headers.
+_TRANSPORTS_BIND_URL = 'parsed_url' in _getargspec(HTTPTransport.__init__)[0]
+
 
 # This module is about logging-only, not wrapping the WSGI application in a
 # middleware, etc.
@@ -49,6 +70,13 @@ try:
 except ImportError:
     from odoo import models
 
+
+from xoutil.names import strlist as strs
+__all__ = strs('conf', 'SENTRYLOGGER', 'get_client', 'patch_logging',
+               'register_tag_extractor', 'SpoolTransport', 'replay_spool',
+               'timed_operation', 'report_slow_operation')
+del strs
+
 # A dictionary holding the Raven's client keyword arguments.  You should
 # modify this dictionary before patching the logging.
 conf = {}
@@ -61,6 +89,59 @@ SENTRYLOGGER = object()
 # A singleton
 _sentry_client = None
 
+# The queue of records when the transport is 'queued'.  See `_RecordsQueue`.
+_records_queue = None
+
+# The rate limiter of repeated records.  See `_FingerprintLimiter`.
+_limiter = None
+
+# The number of SQL statements kept per thread as breadcrumbs (0 disables
+# them).  See `_SQLTrail`.
+_sql_breadcrumbs = 0
+
+# Caps of the data captured in the events.  See `_cap`:func: and
+# `_cap_event`:func:.
+_max_field_size = 4096
+_max_context_size = 64 * 1024
+_max_event_size = 256 * 1024
+_max_frames_with_locals = 0   # No limit
+
+# Slow operations are reported if they take more than `_slow_threshold`
+# seconds (0 disables them), sampled at `_slow_sample_rate`.  See
+# `report_slow_operation`:func:.
+_slow_threshold = 0
+_slow_sample_rate = 0.1
+
+# The prefixes of the paths of the HTTP requests that are not timed.  The
+# bus' long polling requests block on purpose until there's something to
+# send (or a timeout of about 50 seconds).
+_slow_excluded_paths = ('/longpolling/', )
+
+# The handler of the root logger installed by `patch_logging`:func:.
+_handler = None
+
+# Tag extractors registered by addons.  See `register_tag_extractor`.
+_tag_extractors = []
+
+
+def register_tag_extractor(extractor):
+    '''Register a function to extract tags from log records.
+
+    The `extractor` is called with the log record for each record sent to
+    Sentry, and it must return a dictionary of tags (or None).  Errors in
+    the extractor are ignored.
+
+    Return the `extractor`, so it can be used as a decorator::
+
+        @register_tag_extractor
+        def company_tags(record):
+            return {'company': ...}
+
+    '''
+    if extractor not in _tag_extractors:
+        _tag_extractors.append(extractor)
+    return extractor
+
 
 def get_client():
     global _sentry_client
@@ -72,18 +153,891 @@ def get_client():
             except ImportError:
                 from odoo.release import version
             conf['release'] = '%s/%s' % (version, releasetag)
+        queue_options = {
+            'maxsize': int(conf.pop('sentrylog.queue-size', 1000)),
+            'policy': conf.pop('sentrylog.drop-policy', 'newest'),
+            'batch_size': int(conf.pop('sentrylog.batch-size', 50)),
+            'interval': float(conf.pop('sentrylog.flush-interval', 1)),
+        }
+        global _sql_breadcrumbs
+        _sql_breadcrumbs = int(conf.pop('sentrylog.sql-breadcrumbs', 0))
+        global _max_field_size, _max_context_size, _max_frames_with_locals
+        global _max_event_size
+        _max_field_size = int(conf.pop('sentrylog.max-field-size',
+                                       _max_field_size))
+        _max_context_size = int(conf.pop('sentrylog.max-context-size',
+                                         _max_context_size))
+        _max_event_size = int(conf.pop('sentrylog.max-event-size',
+                                       _max_event_size))
+        _max_frames_with_locals = int(
+            conf.pop('sentrylog.max-frames-with-locals',
+                     _max_frames_with_locals)
+        )
+        global _slow_threshold, _slow_sample_rate
+        _slow_threshold = float(conf.pop('sentrylog.slow-threshold',
+                                         _slow_threshold))
+        _slow_sample_rate = float(conf.pop('sentrylog.slow-sample-rate',
+                                           _slow_sample_rate))
+        global _slow_excluded_paths
+        excluded = conf.pop('sentrylog.slow-exclude', None)
+        if excluded is not None:
+            _slow_excluded_paths = tuple(
+                path.strip() for path in excluded.split(',') if path.strip()
+            )
+        rate = float(conf.pop('sentrylog.rate-limit', 0))
+        burst = int(conf.pop('sentrylog.rate-burst', 20))
+        interval = float(conf.pop('sentrylog.summary-interval', 60))
+        if rate > 0:
+            global _limiter
+            _limiter = _FingerprintLimiter(rate, burst, interval)
         transport = conf.get('transport', None)
-        if transport == 'sync':
+        if transport == 'queued':
+            # Events are built and sent by the thread of the queue, there's
+            # no point in having yet another thread in the transport.
+            global _records_queue
+            _records_queue = _RecordsQueue(**queue_options)
+            transport = HTTPTransport
+        elif transport == 'spool':
+            SpoolTransport.directory = conf.pop('sentrylog.spool-dir', None)
+            SpoolTransport.fsync_every = int(
+                conf.pop('sentrylog.spool-fsync-every', 10)
+            )
+            transport = SpoolTransport
+        elif transport == 'sync':
             transport = HTTPTransport
         elif transport == 'gevent':
             transport = GeventedHTTPTransport
         else:
             transport = ThreadedHTTPTransport
         conf['transport'] = transport
-        _sentry_client = raven.Client(**conf)
+        _sentry_client = _Client(**conf)
     return _sentry_client
 
 
+class _RecordsQueue(object):
+    '''A bounded queue of log records to be sent to Sentry in background.
+
+    Records are put by the handler (see `patch_logging`:func:) as
+    ``(send, record)`` pairs; a daemon thread takes them in batches of up to
+    `batch_size` records and calls ``send(record)`` for each one.  The
+    thread wakes up every `interval` seconds, or as soon as a full batch is
+    available.
+
+    When the queue already has `maxsize` records, a record is dropped: the
+    new one if `policy` is 'newest' (the default), or the oldest one in the
+    queue if `policy` is 'oldest'.  Dropped records are counted in `dropped`
+    and reported to Sentry as a warning in the next batch.
+
+    '''
+    def __init__(self, maxsize=1000, policy='newest', batch_size=50,
+                 interval=1):
+        if policy not in ('newest', 'oldest'):
+            raise ValueError('Invalid drop policy %r' % policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = max(batch_size, 1)
+        self.interval = interval
+        self.records = deque()
+        self.dropped = 0   # All records dropped so far
+        self.sent = 0      # All records sent so far
+        self._unreported = 0
+        self._cond = threading.Condition()
+        self._pid = None
+        import atexit
+        atexit.register(self.flush, 5)
+
+    def put(self, send, record):
+        '''Queue the `record`; return False if it was dropped.
+
+        With the 'oldest' policy the record is always queued, though another
+        one may be dropped.
+
+        '''
+        with self._cond:
+            self._ensure_started()
+            if len(self.records) >= self.maxsize:
+                self.dropped += 1
+                self._unreported += 1
+                if self.policy == 'newest':
+                    return False
+                self.records.popleft()
+            self.records.append((send, record))
+            if len(self.records) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def flush(self, timeout=None):
+        '''Wait until the queue is empty or the `timeout` expires.'''
+        from time import time
+        deadline = time() + timeout if timeout is not None else None
+        with self._cond:
+            while self.records and self._pid == os.getpid():
+                self._cond.notify()
+                if deadline is None:
+                    self._cond.wait(0.1)
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(min(remaining, 0.1))
+        return not self.records
+
+    def _ensure_started(self):
+        # Threads don't survive a fork (prefork workers), so we check the pid
+        # instead of merely the thread.
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            thread = threading.Thread(name='xoeuf.sentrylog', target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self.records) < self.batch_size:
+                    self._cond.wait(self.interval)
+                batch = [
+                    self.records.popleft()
+                    for _ in range(min(len(self.records), self.batch_size))
+                ]
+                dropped, self._unreported = self._unreported, 0
+            if dropped:
+                self._report_dropped(dropped)
+            for send, record in batch:
+                try:
+                    send(record)
+                except:  # noqa
+                    # Never let the thread die
+                    pass
+            with self._cond:
+                self.sent += len(batch)
+                # Wake up any thread waiting in `flush`.
+                self._cond.notify_all()
+
+    def _report_dropped(self, dropped):
+        client = get_client()
+        if client:
+            try:
+                client.captureMessage(
+                    'Dropped %d log records: the queue is full' % dropped,
+                    level='warning',
+                    extra={'dropped': dropped, 'total_dropped': self.dropped,
+                           'queue_size': self.maxsize},
+                )
+            except:  # noqa
+                pass
+
+
+class _FingerprintLimiter(object):
+    '''A token-bucket rate limiter of log records.
+
+    Each key (the fingerprint of the record) has a bucket of up to `burst`
+    tokens, refilled at `rate` tokens per second.  A record is allowed if it
+    can take a token from the bucket of its key.
+
+    Records not allowed are counted per key.  Once a record is suppressed, a
+    daemon thread calls `report` with each item of `pop_summaries`:meth:
+    every `interval` seconds, and at exit.
+
+    '''
+    def __init__(self, rate=0.2, burst=20, interval=60, report=None):
+        self.rate = rate
+        self.burst = burst
+        self.interval = interval
+        self.report = report
+        self.buckets = {}     # key -> [tokens, last time]
+        self.suppressed = {}  # key -> [count, (level, logger, message)]
+        self._lock = threading.Lock()
+        self._pid = None
+        import atexit
+        atexit.register(self.flush)
+
+    def allow(self, key, record):
+        '''Return True if the `record` should be sent.'''
+        now = _time()
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True
+            bucket[0] = tokens
+            info = self.suppressed.get(key)
+            if info is None:
+                message = getattr(record, 'message', None) or record.msg
+                self.suppressed[key] = [
+                    1, (record.levelno, record.name, message)
+                ]
+            else:
+                info[0] += 1
+            self._ensure_started()
+        return False
+
+    def flush(self):
+        '''Report the summaries of the records suppressed so far.'''
+        report = self.report
+        for summary in self.pop_summaries():
+            if report is not None:
+                try:
+                    report(summary)
+                except:  # noqa
+                    pass
+
+    def _ensure_started(self):
+        # Threads don't survive a fork (prefork workers), so we check the pid
+        # instead of merely the thread.
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            thread = threading.Thread(name='xoeuf.sentrylog.limiter',
+                                      target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        import time
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def pop_summaries(self):
+        '''Return the list of `(key, count, (level, logger, message))` of
+        the records suppressed since the last call.
+
+        '''
+        now = _time()
+        with self._lock:
+            result = [
+                (key, count, sample)
+                for key, (count, sample) in self.suppressed.items()
+            ]
+            self.suppressed = {}
+            # Forget about the buckets that would be full by now, so that
+            # the memory doesn't grow unbounded.
+            self.buckets = {
+                key: bucket
+                for key, bucket in self.buckets.items()
+                if bucket[0] + (now - bucket[1]) * self.rate < self.burst
+            }
+        return result
+
+
+class _SQLTrail(threading.local):
+    '''A per-thread ring buffer of the last SQL statements executed.
+
+    Each entry is a tuple `(timestamp, query, duration, rowcount)`.  The
+    query is kept as given to the cursor (i.e without the parameters); it's
+    only normalized when the entries are taken by `entries`:meth:.
+
+    '''
+    size = 0  # Set by `_trace_sql`:func:.
+
+    def __init__(self):
+        self.buffer = [None] * self.size
+        self.pos = 0
+
+    def append(self, timestamp, query, duration, rowcount):
+        buffer = self.buffer
+        if buffer:
+            buffer[self.pos] = (timestamp, query, duration, rowcount)
+            self.pos = (self.pos + 1) % len(buffer)
+
+    def entries(self):
+        '''Return the list of entries, oldest first.'''
+        pos = self.pos
+        return [
+            (timestamp, _normalize_sql(query), duration, rowcount)
+            for item in self.buffer[pos:] + self.buffer[:pos]
+            if item is not None
+            for timestamp, query, duration, rowcount in (item, )
+        ]
+
+
+def _normalize_sql(query, maxlength=1024):
+    if not isinstance(query, (type(''), type(u''))):
+        try:
+            query = str(query)
+        except Exception:
+            query = repr(query)
+    return ' '.join(query.split())[:maxlength]
+
+
+_sql_trail = None
+
+
+def _trace_sql(size):
+    '''Patch the cursors to keep the last `size` statements of each thread.'''
+    global _sql_trail
+    if _sql_trail is not None:
+        return
+    try:
+        from openerp import sql_db
+    except ImportError:
+        from odoo import sql_db
+    from functools import wraps
+    _SQLTrail.size = size
+    _sql_trail = trail = _SQLTrail()
+    _execute = sql_db.Cursor.execute
+
+    @wraps(_execute)
+    def execute(self, query, *args, **kwargs):
+        start = _time()
+        try:
+            return _execute(self, query, *args, **kwargs)
+        finally:
+            obj = getattr(self, '_obj', None)
+            trail.append(start, query, _time() - start,
+                         getattr(obj, 'rowcount', -1))
+
+    sql_db.Cursor.execute = execute
+
+
+_TRUNCATED = '...'
+
+# The size (in JSON) of the quotes of strings, the brackets of containers,
+# and the separators of the items of lists and dicts; and of numbers.
+_STRING_OVERHEAD = 2
+_CONTAINER_OVERHEAD = 2
+_ITEM_OVERHEAD = 2
+_KEY_OVERHEAD = 2
+_SCALAR_SIZE = 8
+
+
+def _cap(value, budget, depth=0):
+    '''Return a copy of `value` within the size limits.
+
+    Strings are truncated to `_max_field_size` characters.  `budget` is a
+    one-item list with the size still available; it's reduced by the size
+    `value` would take serialized as JSON (see `_size`:func:).  Once
+    exhausted the rest of the items of containers are dropped.  So, big
+    payloads are never copied completely.
+
+    Objects other than strings, numbers, lists and dicts are replaced by
+    their (truncated) `repr`.
+
+    '''
+    if budget[0] <= 0 or depth > 10:
+        budget[0] -= len(_TRUNCATED) + _STRING_OVERHEAD
+        return _TRUNCATED
+    if isinstance(value, (bytes, type(u''))):
+        if len(value) > _max_field_size:
+            suffix = b'...' if isinstance(value, bytes) else u'...'
+            value = value[:_max_field_size] + suffix
+        budget[0] -= len(value) + _STRING_OVERHEAD
+        return value
+    elif isinstance(value, dict):
+        return _cap_items(value.items(), budget, depth + 1)
+    elif isinstance(value, (list, tuple)):
+        budget[0] -= _CONTAINER_OVERHEAD
+        result = []
+        for item in value:
+            if budget[0] <= 0:
+                result.append(_cap(_TRUNCATED, budget, depth + 1))
+                break
+            budget[0] -= _ITEM_OVERHEAD
+            result.append(_cap(item, budget, depth + 1))
+        return result
+    elif value is None or isinstance(value, (bool, int, float)):
+        budget[0] -= _SCALAR_SIZE
+        return value
+    else:
+        return _cap(_repr(value), budget, depth)
+
+
+def _cap_items(items, budget, depth=0):
+    '''Return a dict of `items` within the size limits.  See `_cap`.'''
+    budget[0] -= _CONTAINER_OVERHEAD
+    result = {}
+    for key, value in items:
+        if budget[0] <= 0:
+            budget[0] -= 2 * (len(_TRUNCATED) + _STRING_OVERHEAD)
+            result[_TRUNCATED] = _TRUNCATED
+            break
+        budget[0] -= _size(key) + _KEY_OVERHEAD + _ITEM_OVERHEAD
+        result[key] = _cap(value, budget, depth)
+    return result
+
+
+def _size(value):
+    '''Return the size `value` would take serialized as JSON.
+
+    This is an estimation which counts strings as if they had no escaped
+    characters and numbers as `_SCALAR_SIZE`.  `_cap`:func: counts the same
+    way.
+
+    '''
+    if isinstance(value, (bytes, type(u''))):
+        return len(value) + _STRING_OVERHEAD
+    elif isinstance(value, dict):
+        return _CONTAINER_OVERHEAD + sum(
+            _size(key) + _KEY_OVERHEAD + _size(item) + _ITEM_OVERHEAD
+            for key, item in value.items()
+        )
+    elif isinstance(value, (list, tuple)):
+        return _CONTAINER_OVERHEAD + sum(
+            _size(item) + _ITEM_OVERHEAD for item in value
+        )
+    elif value is None or isinstance(value, (bool, int, float)):
+        return _SCALAR_SIZE
+    else:
+        return _size(_repr(value))
+
+
+def _repr(value):
+    try:
+        return repr(value)
+    except Exception:
+        return object.__repr__(value)
+
+
+# The parts of the events trimmed by `_cap_event`, all other are kept as
+# they are.
+_TRIMMED_KEYS = ('request', 'sentry.interfaces.Http', 'extra',
+                 'breadcrumbs')
+
+
+def _cap_event(data, size):
+    '''Trim the event `data` (as built by Raven) to about `size` bytes.
+
+    The event is trimmed in place.  Everything but the HTTP request, the
+    locals of the frames, the extra data and the breadcrumbs is kept.
+    What's left of `size` is spent on (in this order): the request (dropped
+    if nothing is left), the locals of the frames (innermost first; the
+    locals of the frames that don't fit are dropped), the extra data, and
+    the breadcrumbs (newest first).
+
+    '''
+    frames = [frame for frame in _iter_frames(data) if frame.get('vars')]
+    variables = [frame.pop('vars') for frame in frames]
+    budget = [size - _CONTAINER_OVERHEAD - sum(
+        _size(key) + _KEY_OVERHEAD + _ITEM_OVERHEAD +
+        (_size(value) if key not in _TRIMMED_KEYS else 0)
+        for key, value in data.items()
+    )]
+    for key in ('request', 'sentry.interfaces.Http'):
+        if key in data:
+            if budget[0] > 0:
+                data[key] = _cap(data[key], budget)
+            else:
+                del data[key]
+    for frame, value in reversed(list(zip(frames, variables))):
+        needed = _size('vars') + _KEY_OVERHEAD + _size(value) + _ITEM_OVERHEAD
+        if needed <= budget[0]:
+            frame['vars'] = value
+            budget[0] -= needed
+    if 'extra' in data:
+        data['extra'] = _cap_items(data['extra'].items(), budget)
+    breadcrumbs = data.get('breadcrumbs')
+    if breadcrumbs and breadcrumbs.get('values'):
+        budget[0] -= _size(dict(breadcrumbs, values=[]))
+        kept = []
+        for crumb in reversed(breadcrumbs['values']):
+            needed = _size(crumb) + _ITEM_OVERHEAD
+            if needed > budget[0]:
+                break
+            kept.append(crumb)
+            budget[0] -= needed
+        breadcrumbs['values'] = kept[::-1]
+    return data
+
+
+def _iter_frames(data):
+    stacks = [data.get('stacktrace')]
+    exception = data.get('exception')
+    if exception:
+        stacks.extend(value.get('stacktrace')
+                      for value in exception.get('values', ()))
+    for stack in stacks:
+        if stack:
+            for frame in stack.get('frames', ()):
+                yield frame
+
+
+class _Client(raven.Client):
+    '''A Raven client which caps the size of the events it sends.
+
+    See `_cap_event`:func:.
+
+    '''
+    def send(self, auth_header=None, **data):
+        if _max_event_size:
+            _cap_event(data, _max_event_size)
+        return super(_Client, self).send(auth_header=auth_header, **data)
+
+
+def _limit_frames_with_locals(count):
+    '''Patch Raven to collect the locals of only the innermost `count`
+    frames of stack traces.
+
+    Raven collects the locals of every frame and then drops those of the
+    frames in the middle if there are too many.
+
+    '''
+    import sys
+    from raven import base, events
+    from raven.utils import stacks
+    get_stack_info = stacks.get_stack_info
+
+    def _get_stack_info(frames, transformer=stacks.transform,
+                        capture_locals=True, frame_allowance=25):
+        __traceback_hide__ = True  # noqa
+        if not capture_locals:
+            return get_stack_info(frames, transformer=transformer,
+                                  capture_locals=False,
+                                  frame_allowance=frame_allowance)
+        frames = list(frames)
+        outer, inner = frames[:-count], frames[-count:]
+        result = get_stack_info(outer, transformer=transformer,
+                                capture_locals=False,
+                                frame_allowance=sys.maxsize)['frames']
+        result += get_stack_info(inner, transformer=transformer,
+                                 capture_locals=True,
+                                 frame_allowance=sys.maxsize)['frames']
+        return {
+            'frames': stacks.slim_frame_data(result,
+                                             frame_allowance=frame_allowance)
+        }
+
+    base.get_stack_info = events.get_stack_info = _get_stack_info
+
+
+@contextmanager
+def timed_operation(kind, name):
+    '''Report the enclosed operation if it's slow.
+
+    See `report_slow_operation`:func:.  Example::
+
+        with timed_operation('import', filename):
+            ...
+
+    '''
+    start = _time()
+    try:
+        yield
+    finally:
+        report_slow_operation(kind, name, _time() - start)
+
+
+def report_slow_operation(kind, name, duration):
+    '''Send a "slow operation" event if the `duration` is too long.
+
+    :param kind: The kind of operation (e.g 'rpc', 'cron').  It's sent as
+           the tag 'slow'.
+
+    :param name: The name of the operation (e.g the model and method).
+           Events are grouped by `kind` and `name`.
+
+    :param duration: The seconds the operation took.
+
+    The event is only sent if `duration` exceeds the ``sentrylog.slow-
+    threshold`` of `conf`:obj:, and then only a sample of them (with the
+    ``sentrylog.slow-sample-rate``).  Events have the same tags and context
+    (HTTP request, user, etc) than error reports, so call this function in
+    the thread of the operation.
+
+    Return True if the event was sent.
+
+    '''
+    handler = _handler
+    if not handler or not _slow_threshold or duration < _slow_threshold:
+        return False
+    if random.random() >= _slow_sample_rate:
+        return False
+    import logging
+    record = logging.LogRecord(
+        'xoeuf.sentrylog.slow', logging.WARNING, __file__, 0,
+        'Slow %s: %s took %.2fs', (kind, name, duration), None
+    )
+    record.tags = {'slow': kind}
+    record.fingerprint = ['xoeuf.sentrylog.slow', kind, str(name)]
+    record.duration = duration
+    record.threshold = _slow_threshold
+    handler.handle(record)
+    return True
+
+
+def _time_operations():
+    '''Patch Odoo to report slow RPC calls and cron jobs.'''
+    try:
+        from openerp import http
+    except ImportError:
+        from odoo import http
+    _call_function = http.WebRequest._call_function
+    _dispatch_rpc = http.dispatch_rpc
+
+    @wraps(_call_function)
+    def call_function(self, *args, **kwargs):
+        if _is_excluded_request(self):
+            return _call_function(self, *args, **kwargs)
+        with timed_operation('rpc', _get_rpc_name(self)):
+            return _call_function(self, *args, **kwargs)
+
+    @wraps(_dispatch_rpc)
+    def dispatch_rpc(service_name, method, params):
+        with timed_operation('rpc', '%s.%s' % (service_name, method)):
+            return _dispatch_rpc(service_name, method, params)
+
+    http.WebRequest._call_function = call_function
+    http.dispatch_rpc = dispatch_rpc
+
+    try:
+        try:
+            from openerp.addons.base.ir.ir_cron import ir_cron
+        except ImportError:
+            from odoo.addons.base.ir.ir_cron import ir_cron
+    except ImportError:
+        return
+    _callback = ir_cron._callback
+
+    # The signature is (cr, uid, model_name, method_name, args, job_id) in
+    # Odoo 8, and (model_name, method_name, args, job_id) in Odoo 10.
+    @wraps(_callback)
+    def callback(self, *args, **kwargs):
+        name = '%s.%s' % tuple(args[-4:-2]) if len(args) >= 4 else None
+        with timed_operation('cron', name):
+            return _callback(self, *args, **kwargs)
+
+    ir_cron._callback = callback
+
+
+def _is_excluded_request(request):
+    '''Whether the `request` is not timed (see ``sentrylog.slow-exclude``).'''
+    try:
+        path = request.httprequest.path
+    except Exception:
+        return False
+    return bool(path) and any(path.startswith(prefix)
+                              for prefix in _slow_excluded_paths)
+
+
+def _get_rpc_name(request):
+    try:
+        name = request.httprequest.path
+        params = getattr(request, 'params', None) or {}
+        model, method = params.get('model'), params.get('method')
+        if model and method:
+            name = '%s (%s.%s)' % (name, model, method)
+        return name
+    except Exception:
+        return None
+
+
+def _get_spool_dir(directory=None):
+    if not directory:
+        import tempfile
+        directory = os.path.join(tempfile.gettempdir(), 'xoeuf-sentrylog')
+    return directory
+
+
+# Spool files are rotated when they reach this size.
+_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class SpoolTransport(Transport):
+    '''A Raven transport that appends the events to files in a directory.
+
+    This is meant for short-lived processes (e.g the mailgate) which should
+    neither wait for the Sentry, nor lose events when it's unreachable.  Use
+    `replay_spool`:func: (or the ``xoeuf sentrylog-replay`` command) to send
+    the spooled events.
+
+    Each process writes its own file ``<pid>-<time>-<random>.part`` which is
+    renamed to ``.spool`` when closed (at exit or when it grows too big).
+    The file is flushed after each event but it's only synced to disk every
+    `fsync_every` events, and when closed.
+
+    '''
+    scheme = ['spool+http', 'spool+https']
+
+    # Configured by `get_client`:func:.
+    directory = None
+    fsync_every = 10
+
+    def __init__(self, parsed_url=None, **options):
+        # Options of the DSN (timeout, etc) don't apply.
+        self._url = parsed_url.geturl() if parsed_url is not None else None
+        self._lock = threading.Lock()
+        self._file = self._path = self._pid = None
+        self._unsynced = 0
+        import atexit
+        atexit.register(self.close)
+
+    def send(self, *args):
+        # Raven 6 passes `(url, data, headers)`; older versions pass `(data,
+        # headers)` and gave the URL to the constructor.
+        if len(args) == 2:
+            url, (data, headers) = self._url, args
+        else:
+            url, data, headers = args
+        event = {
+            'url': url,
+            'headers': dict(headers),
+            'data': base64.b64encode(data).decode('ascii'),
+        }
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        with self._lock:
+            fh = self._get_file()
+            fh.write(line)
+            fh.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+            if fh.tell() >= _SPOOL_MAX_SIZE:
+                self._close()
+
+    def close(self):
+        '''Sync and close the current file, so it can be replayed.'''
+        with self._lock:
+            self._close()
+
+    def _get_file(self):
+        pid = os.getpid()
+        if self._file is None or self._pid != pid:
+            # After a fork, the file belongs to the parent process.
+            import uuid
+            directory = _get_spool_dir(self.directory)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            name = '%d-%d-%s' % (pid, _time() * 1000, uuid.uuid4().hex[:8])
+            self._path = os.path.join(directory, name)
+            self._file = open(self._path + '.part', 'ab')
+            self._pid = pid
+            self._unsynced = 0
+        return self._file
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _close(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._sync()
+            self._file.close()
+            os.rename(self._path + '.part', self._path + '.spool')
+        self._file = self._path = self._pid = None
+
+
+def replay_spool(directory=None, url=None, transport=None, timeout=None):
+    '''Send the events spooled by `SpoolTransport`:class:.
+
+    :param directory: The spool directory.  Defaults to the same default of
+           the ``sentrylog.spool-dir`` key of `conf`:obj:.
+
+    :param url: If given, send all the events to this URL instead of the
+           one they were spooled with (e.g a local stand-in of Sentry).
+
+    :param transport: An object whose method ``send(url, data, headers)``
+           sends each event (e.g a transport of Raven 6).  Defaults to
+           sending them synchronously by HTTP.
+
+    :param timeout: The timeout in seconds of each HTTP request, if no
+           `transport` is given.  Defaults to the one of Raven.
+
+    Files left by processes that are no longer running are replayed as
+    well.  Several replays may run at the same time: each file is claimed
+    by renaming it (files claimed by replays that are no longer running are
+    claimed again).  At the first failure, the events not yet sent are
+    spooled back and the replay stops.
+
+    Return a tuple with the number of events sent and left in the spool.
+
+    '''
+    directory = _get_spool_dir(directory)
+    if transport is None:
+        options = {'timeout': timeout} if timeout is not None else {}
+        transport = _HTTPSender(**options)
+    sent = left = 0
+    if not os.path.isdir(directory):
+        return sent, left
+    replaying = '.replaying-%d' % os.getpid()
+    for filename in sorted(os.listdir(directory)):
+        base, ext = os.path.splitext(filename)
+        if ext == '.part':
+            owner = base.split('-', 1)[0]
+        elif ext.startswith('.replaying-') and ext != replaying:
+            owner = ext[len('.replaying-'):]
+        elif ext == '.spool':
+            owner = None
+        else:
+            continue
+        if owner and _is_running(owner):
+            continue
+        path = os.path.join(directory, filename)
+        claimed = os.path.join(directory, base + replaying)
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue  # Another replay took it.
+        remaining = []
+        with open(claimed, 'rb') as fh:
+            for line in fh:
+                if left:
+                    remaining.append(line)
+                    left += 1
+                    continue
+                try:
+                    event = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue  # A truncated line, from a crashed process
+                try:
+                    transport.send(url or event['url'],
+                                   base64.b64decode(event['data']),
+                                   event['headers'])
+                except Exception:
+                    remaining.append(line)
+                    left += 1
+                else:
+                    sent += 1
+        if remaining:
+            with open(os.path.join(directory, base + '.spool'), 'ab') as fh:
+                fh.writelines(remaining)
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.unlink(claimed)
+        if left:
+            break
+    return sent, left
+
+
+class _HTTPSender(object):
+    '''Send events by HTTP to any URL with any version of Raven.'''
+    def __init__(self, **options):
+        self.options = options
+        self._transports = {}
+
+    def send(self, url, data, headers):
+        if _TRANSPORTS_BIND_URL:
+            transport = self._transports.get(url)
+            if transport is None:
+                transport = self._transports[url] = HTTPTransport(
+                    _urlparse.urlparse(url), **self.options
+                )
+            transport.send(data, headers)
+        else:
+            transport = self._transports.get(None)
+            if transport is None:
+                transport = self._transports[None] = HTTPTransport(
+                    **self.options
+                )
+            transport.send(url, data, headers)
+
+
+def _is_running(pid):
+    import errno
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return False
+    except OSError as error:
+        return error.errno == errno.EPERM
+    else:
+        return True
+
+
 def patch_logging(override=True, force=False):
     '''Patch openerp's logging.
 
@@ -145,15 +1099,95 @@ def patch_logging(override=True, force=False):
         return inner
 
     class SentryHandler(Base):
+        # The `_RecordsQueue` when the transport is 'queued'.
+        queue = None
+
+        # The `_FingerprintLimiter`, if any.
+        limiter = None
+
+        def __init__(self, *args, **kwargs):
+            super(SentryHandler, self).__init__(*args, **kwargs)
+            # Per-process constants and the tag handlers are computed only
+            # once, instead of for each record.
+            self._cli_command = self._get_cli_command()
+            self._tag_handlers = tuple(
+                getattr(self, m)
+                for m in sorted(dir(self)) if m.startswith('_handle_')
+            )
+
         def _emit(self, record, **kwargs):
+            limiter = self.limiter
+            if limiter is not None:
+                key = self._get_limiter_key(record)
+                if key is not None and not limiter.allow(key, record):
+                    return
+            self._snapshot(record)
+            self._dispatch(self._send, record, **kwargs)
+
+        def _dispatch(self, send, arg, **kwargs):
+            if self.queue is not None:
+                self.queue.put(send, arg)
+            else:
+                send(arg, **kwargs)
+
+        def _get_limiter_key(self, record):
+            # Only records with a fingerprint are rate-limited.
+            self._handle_fingerprint(record)
+            fingerprint = getattr(record, 'fingerprint', None)
+            if fingerprint:
+                return tuple(fingerprint)
+            else:
+                return None
+
+        def _report_summary(self, summary):
+            self._dispatch(self._send_summary, summary)
+
+        def _send_summary(self, summary):
+            key, count, (level, name, message) = summary
+            try:
+                self.client.captureMessage(
+                    'Suppressed %d repetitions of: %s' % (count, message),
+                    level=level,
+                    fingerprint=['xoeuf.sentrylog.summary'] + [
+                        str(part) for part in key
+                    ],
+                    tags={'logger': name},
+                    extra={'count': count},
+                )
+            except:  # noqa
+                pass
+
+        def _snapshot(self, record):
+            # Capture everything that depends on the current thread (the
+            # HTTP request, mostly); the event may be built in another
+            # thread.  Attributes starting with '_' are not sent as 'extra'.
             self.set_record_tags(record)
-            request_context = self._get_http_context(record)
+            record._sentry_http_context = self._get_http_context(record)
+            record._sentry_user_context = self._get_user_context(record)
+            if _sql_trail is not None:
+                record._sentry_sql = _sql_trail.entries()
+
+        def _send(self, record, **kwargs):
+            request_context = record._sentry_http_context
             if request_context:
                 self.client.http_context(request_context)
-            user_context = self._get_user_context(record)
+            user_context = record._sentry_user_context
             if user_context:
                 self.client.user_context(user_context)
             try:
+                # Raven < 6 has no breadcrumbs.
+                breadcrumbs = getattr(self.client.context, 'breadcrumbs',
+                                      None)
+                if breadcrumbs is not None:
+                    for timestamp, query, duration, rowcount in \
+                            getattr(record, '_sentry_sql', ()):
+                        breadcrumbs.record(
+                            timestamp=timestamp,
+                            message=query,
+                            category='query',
+                            data={'duration': '%.1fms' % (duration * 1000),
+                                  'rowcount': rowcount},
+                        )
                 super(SentryHandler, self)._emit(record, **kwargs)
             except:
                 # We should never fail if emitting the log to Sentry fails.
@@ -167,14 +1201,19 @@ def patch_logging(override=True, force=False):
         @_require_httprequest
         def _get_http_context(self, record, request):
             urlparts = _urlparse.urlsplit(request.url)
+            # Headers and environ are usually small, but the data may be
+            # huge (e.g uploads), so it goes last.
+            budget = [_max_context_size]
+            headers = _cap_items(get_headers(request.environ), budget)
+            env = _cap_items(get_environ(request.environ), budget)
             return {
                 'url': '%s://%s%s' % (urlparts.scheme, urlparts.netloc,
                                       urlparts.path),
-                'query_string': urlparts.query,
+                'query_string': _cap(urlparts.query, budget),
                 'method': request.method,
-                'data': self._get_http_request_data(request),
-                'headers': dict(get_headers(request.environ)),
-                'env': dict(get_environ(request.environ)),
+                'data': _cap(self._get_http_request_data(request), budget),
+                'headers': headers,
+                'env': env,
             }
 
         @_require_httprequest
@@ -184,9 +1223,15 @@ def patch_logging(override=True, force=False):
             }
 
         def _handle_cli_tags(self, record):
+            cmd = self._cli_command
+            if cmd:
+                tags = setdefaultattr(record, 'tags', {})
+                tags['cmd'] = cmd
+
+        @staticmethod
+        def _get_cli_command():
             import sys
             from itertools import takewhile
-            tags = setdefaultattr(record, 'tags', {})
             if sys.argv:
                 cmd = ' '.join(
                     takewhile(lambda arg: not arg.startswith('-'),
@@ -195,10 +1240,8 @@ def patch_logging(override=True, force=False):
             else:
                 cmd = None
             if cmd:
-                import os
                 cmd = os.path.basename(cmd)
-            if cmd:
-                tags['cmd'] = cmd
+            return cmd
 
         @_require_httprequest
         def _handle_browser_tags(self, record, request):
@@ -276,27 +1319,45 @@ def patch_logging(override=True, force=False):
             return not isinstance(value, ignored)
 
         def set_record_tags(self, record):
-            methods = (
-                getattr(self, m)
-                for m in dir(self) if m.startswith('_handle_')
-            )
-            for method in methods:
+            for method in self._tag_handlers:
                 method(record)
+            for extractor in _tag_extractors:
+                try:
+                    tags = extractor(record)
+                except:  # noqa
+                    tags = None
+                if tags:
+                    setdefaultattr(record, 'tags', {}).update(tags)
 
     client = get_client()
     if not client:
         return
 
+    global _handler
+    if _sql_breadcrumbs:
+        _trace_sql(_sql_breadcrumbs)
+    if _max_frames_with_locals:
+        _limit_frames_with_locals(_max_frames_with_locals)
+    if _slow_threshold and _handler is None:
+        _time_operations()
+
     level = conf.get('report_level', 'ERROR')
 
     def sethandler(logger, override=override, level=level):
         handler = SentryHandler(client=client)
+        handler.queue = _records_queue
+        handler.limiter = _limiter
         handler.setLevel(getattr(logging, level.upper(), logging.ERROR))
         if override or not logger.handlers:
             logger.handlers = [handler]
         else:
             logger.handlers.append(handler)
+        return handler
 
     for name in (None, 'openerp'):
         logger = logging.getLogger(name)
-        sethandler(logger)
+        handler = sethandler(logger)
+        if name is None:
+            _handler = handler
+            if _limiter is not None:
+                _limiter.report = handler._report_summary
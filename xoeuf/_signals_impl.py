@@ -23,10 +23,47 @@ import logging
 logger = logging.getLogger(__name__)
 del logging
 
+import os
+import sys
+import copy
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, closing
+from functools import partial
+from timeit import default_timer as _timer
+from types import MethodType
+from weakref import ref as _weakref, WeakSet
+
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
+
 try:
-    from openerp import api, models
+    from openerp import api, models, sql_db
+    from openerp.tools import config
 except ImportError:  # Odoo 10+
-    from odoo import api, models
+    from odoo import api, models, sql_db
+    from odoo.tools import config
+
+
+from xoutil.names import strlist as strs
+__all__ = strs('Signal', 'PostCommitSignal', 'OutboxSignal', 'Receiver',
+               'receiver', 'filtered', 'filtered_domain', 'suppressed',
+               'drain_outbox', 'listen_remote_signals', 'REMOTE_CHANNEL',
+               'instrument_receivers', 'reset_receivers_stats',
+               'get_receivers_stats', 'receivers_report',
+               'pre_fields_view_get', 'post_fields_view_get',
+               'pre_create', 'post_create',
+               'pre_create_multi', 'post_create_multi',
+               'pre_write', 'post_write', 'pre_unlink', 'post_unlink',
+               'post_commit_create', 'post_commit_write',
+               'post_commit_unlink', 'outbox_create', 'outbox_write',
+               'outbox_unlink', 'remote_post_save',
+               'pre_save', 'post_save', 'post_commit_save', 'outbox_save')
+del strs
 
 
 def _make_id(target):
@@ -55,20 +92,92 @@ def _make_model_id(sender):
         return sender
 
 
+# All signals.  See `_update_senders`.
+_signals = WeakSet()
+
+# The sender keys with receivers, per action.  The key None means any
+# sender.  The ORM methods skip the dispatch entirely for models not listed
+# here.
+_senders = {}
+_senders_lock = threading.Lock()
+
+# Incremented each time the receivers of an action change.
+_generations = {}
+
+
+def _actions(action):
+    '''The actions of a signal: it may be a single action or a tuple.'''
+    return action if isinstance(action, tuple) else (action, )
+
+
+def _update_senders(action):
+    with _senders_lock:
+        for action in _actions(action):
+            keys = set()
+            for signal in list(_signals):
+                if action in _actions(signal.action):
+                    keys.update(signal._dispatch)
+            _senders[action] = frozenset(keys)
+            _generations[action] = _generations.get(action, 0) + 1
+
+
+def _has_receivers(action, model):
+    '''Return True if any signal for `action` may have a receiver for
+    `model`.
+
+    '''
+    senders = _senders.get(action, ())
+    return None in senders or model._name in senders
+
+
 class Signal(object):
     """Base class for all signals
 
     Internal attributes:
 
         receivers
-            [(receriverkey (id), receiver)]
+            OrderedDict {(receiverkey (id), senderkey): receiver}
+
+        _dispatch
+            {senderkey: (receiver, ...)}
+
+            The receivers indexed by sender key.  The key None holds the
+            receivers for any sender; every other key also includes those (in
+            connection order).  This is never updated in place, `connect` and
+            `disconnect` replace it with a new index.
+
+        _dead
+            True if any weakly referenced receiver has been garbage
+            collected but not yet removed.
+
     """
+    # Whether receivers may be connected with `concurrent=True`.  Signals
+    # sent within the sender's transaction (e.g `post_write`) don't allow
+    # them: the receiver wouldn't see the sender's uncommitted changes.
+    concurrent_receivers = True
+
+    # Whether receivers may be connected with `cacheable=True`.  Only the
+    # signals of 'fields_view_get' cache their results.
+    cacheable_receivers = False
+
+    # Whether receivers decorated with `filtered_domain`:func: may be
+    # connected.  Signals whose sender has no records to filter (e.g
+    # `pre_create`:obj:) or whose records are deleted don't allow them: the
+    # receiver would never be called.
+    domain_receivers = True
+
     def __init__(self, action=None, doc=None):
-        self.receivers = []
+        self.receivers = OrderedDict()
         self.action = action
         self.__doc__ = doc
-
-    def connect(self, receiver, sender=None, require_registry=True):
+        self._dispatch = {}
+        self._dead = False
+        self._lock = threading.Lock()
+        _signals.add(self)
+
+    def connect(self, receiver, sender=None, require_registry=True,
+                fields=None, coalesce=False, weak=False, concurrent=False,
+                cacheable=False):
         """Connect receiver to sender for signal.
 
         :param receiver: A function or an instance method which is to receive
@@ -82,31 +191,157 @@ class Signal(object):
         :param require_registry: If True the receiver will only be called if a
                the actual `sender` of the signal has a ready DB registry.
 
+        :param fields: The names (or the name) of the fields the receiver is
+               interested in.  If given, the receiver is only called when
+               the `values` sent with the signal include any of these
+               fields.  This is mostly useful for `pre_write`:obj: and
+               `post_write`:obj:.  Signals sent without `values` are not
+               filtered.
+
+        :param coalesce: If True, the calls to the receiver are delayed until
+               the transaction is about to be committed.  Signals for the
+               same record are coalesced: the receiver is called once per
+               record with the merged `values` (the last value of each
+               field wins).  Records with the same merged `values` are sent
+               together.  This only applies to signals sent by a recordset;
+               the response of the receiver is lost.  This is meant for
+               `post_write`:obj:.  The receiver is called at most once per
+               record and commit: changes made after the flush (e.g by the
+               receiver itself) are not sent again.  Errors in the receiver
+               are logged and ignored.
+
+        :param weak: If True, the signal only keeps a weak reference to the
+               receiver; once the receiver is garbage collected it's
+               disconnected.  The default is False: the signal keeps the
+               receiver alive, so lambdas, partials and inner functions can
+               be connected.  Use True for receivers bound to objects whose
+               life-time the signal must not extend.
+
+        :param concurrent: If True, `safe_send` calls the receiver in a pool
+               of threads, together with the other concurrent receivers,
+               after the other receivers.  If the sender is a recordset,
+               the receiver gets the same records in an environment with
+               the cursor of its thread, which is rolled back afterwards:
+               it doesn't see uncommitted changes of the sender's
+               transaction and must not write.  So, this is only allowed
+               for signals sent outside the sender's transaction (e.g
+               `post_commit_write`:obj:), a ValueError is raised otherwise.
+               This is meant for independent read-only receivers (indexing,
+               metrics, etc).  The size of the pool is taken from the
+               option ``signals_concurrent_workers`` (default 4) of the
+               Odoo configuration.
+
+        :param cacheable: If True, the receiver allows the result of the
+               method to be cached.  This is only allowed for
+               `pre_fields_view_get`:obj: and `post_fields_view_get`:obj:, a
+               ValueError is raised otherwise.  The result of
+               `fields_view_get` is only cached for models whose receivers
+               are all cacheable.
+
+        Receivers decorated with `filtered_domain`:func: are not allowed for
+        signals whose sender is an empty recordset or deleted records (e.g
+        `pre_create`:obj: or `post_unlink`:obj:), a ValueError is raised.
+
         :return: None
 
         """
+        if concurrent and not self.concurrent_receivers:
+            raise ValueError(
+                'Concurrent receivers are not allowed for signals sent '
+                'within the transaction of the sender'
+            )
+        if cacheable and not self.cacheable_receivers:
+            raise ValueError('Cacheable receivers are not allowed for '
+                             'signals which don\'t cache their results')
+        if _get_domain(receiver) is not None and not self.domain_receivers:
+            raise ValueError('Receivers filtered by domain are not allowed '
+                             'for signals without records to filter')
         if not isinstance(sender, (list, tuple)):
             sender = [sender]
-        for s in sender:
-            lookup_key = (_make_id(receiver), _make_model_id(s))
-            if not any(lookup_key == r_key for r_key, _ in self.receivers):
-                self.receivers.append(
-                    (lookup_key,
-                     Receiver(receiver, sender=sender,
-                              require_registry=require_registry))
-                )
+        with self._lock:
+            if self._dead:
+                self._prune()
+            for s in sender:
+                senderkey = _make_model_id(s)
+                lookup_key = (_make_id(receiver), senderkey)
+                if lookup_key not in self.receivers:
+                    item = Receiver(receiver, senderkey=senderkey,
+                                    require_registry=require_registry,
+                                    fields=fields, coalesce=coalesce,
+                                    concurrent=concurrent, weak=weak,
+                                    cacheable=cacheable,
+                                    on_dead=self._receiver_died)
+                    self.receivers[lookup_key] = item
+                    self._add_to_dispatch(item)
 
     def disconnect(self, receiver=None, sender=None):
         """Disconnect receiver from sender for signal.
 
         :param receiver: The registered receiver to disconnect.
 
-        :param sender: The registered sender to disconnect
+        :param sender: The registered sender(s) to disconnect.
 
         """
-        receiver_item = (_make_id(receiver), sender), receiver
-        if receiver_item in self.receivers:
-            sender.receivers.remove(receiver_item)
+        if not isinstance(sender, (list, tuple)):
+            sender = [sender]
+        keys = [(_make_id(receiver), _make_model_id(s)) for s in sender]
+        with self._lock:
+            removed = [
+                self.receivers.pop(key)
+                for key in keys
+                if key in self.receivers
+            ]
+            if removed:
+                self._remove_from_dispatch(removed)
+
+    # The following methods must be called with the lock acquired.
+    def _add_to_dispatch(self, receiver):
+        senderkey = receiver.senderkey
+        if senderkey is None:
+            dispatch = {
+                key: bucket + (receiver, )
+                for key, bucket in self._dispatch.items()
+            }
+            dispatch.setdefault(None, (receiver, ))
+        else:
+            dispatch = dict(self._dispatch)
+            bucket = dispatch.get(senderkey, None)
+            if bucket is None:
+                bucket = dispatch.get(None, ())
+            dispatch[senderkey] = bucket + (receiver, )
+        self._dispatch = dispatch
+        _update_senders(self.action)
+
+    def _remove_from_dispatch(self, removed):
+        ids = {id(receiver) for receiver in removed}
+        dispatch = dict(self._dispatch)
+        senderkeys = {receiver.senderkey for receiver in removed}
+        if None in senderkeys:
+            affected = list(dispatch)
+        else:
+            affected = [key for key in senderkeys if key in dispatch]
+        for key in affected:
+            bucket = tuple(r for r in dispatch[key] if id(r) not in ids)
+            # Buckets of a sender with only receivers for any sender are
+            # dropped: the bucket None serves them.
+            if bucket and (key is None or
+                           any(r.senderkey == key for r in bucket)):
+                dispatch[key] = bucket
+            else:
+                del dispatch[key]
+        self._dispatch = dispatch
+        _update_senders(self.action)
+
+    def _prune(self):
+        self._dead = False
+        dead = [key for key, r in self.receivers.items() if r.dead]
+        if dead:
+            self._remove_from_dispatch([self.receivers.pop(key)
+                                        for key in dead])
+
+    def _receiver_died(self, ref):
+        # Called by the GC: don't lock here, prune on the next use.
+        self._dead = True
 
     def has_listeners(self, sender=None):
         return bool(self._live_receivers(sender))
@@ -127,10 +362,16 @@ class Signal(object):
 
         """
         responses = []
-        if not self.receivers:
+        if not self.receivers or self._suppressed(sender, kwargs):
             return responses
-        for receiver in self._live_receivers(sender):
-            response = receiver(sender, signal=self, **kwargs)
+        timed = _instrumented
+        for receiver in self._live_receivers(sender, kwargs.get('values')):
+            if receiver.coalesce and _coalesce(self, receiver, sender, kwargs):
+                continue
+            if timed:
+                response = _timed_call(self, receiver, sender, kwargs)
+            else:
+                response = receiver(sender, signal=self, **kwargs)
             responses.append((receiver, response))
         return responses
 
@@ -157,11 +398,21 @@ class Signal(object):
         responses = []
         if thrown and not isinstance(thrown, (list, tuple)):
             thrown = (thrown, )
-        if not self.receivers:
+        if not self.receivers or self._suppressed(sender, kwargs):
             return responses
-        for receiver in self._live_receivers(sender):
+        timed = _instrumented
+        concurrent = []
+        for receiver in self._live_receivers(sender, kwargs.get('values')):
+            if receiver.coalesce and _coalesce(self, receiver, sender, kwargs):
+                continue
+            if receiver.concurrent:
+                concurrent.append(receiver)
+                continue
             try:
-                response = receiver(sender, signal=self, **kwargs)
+                if timed:
+                    response = _timed_call(self, receiver, sender, kwargs)
+                else:
+                    response = receiver(sender, signal=self, **kwargs)
             except catched as err:
                 if thrown and isinstance(err, thrown):
                     # Don't log: I expect you'll log where you actually catch
@@ -175,23 +426,76 @@ class Signal(object):
                 raise
             else:
                 responses.append((receiver, response))
+        if concurrent:
+            for receiver, response, error in _run_concurrently(
+                    self, concurrent, sender, kwargs):
+                if error is None:
+                    responses.append((receiver, response))
+                elif isinstance(error, catched) and \
+                        not (thrown and isinstance(error, thrown)):
+                    logger.error('Error in receiver %r', receiver.receiver,
+                                 exc_info=error._exc_info)
+                    responses.append((receiver, error))
+                else:
+                    raise error
         return responses
 
-    def _live_receivers(self, sender):
+    def _suppressed(self, sender, kwargs):
+        '''Return True if the signal is `suppressed`:func: for `sender`.
+
+        If the suppressing block collects the ids, those of `sender` (and
+        those of the `result` or `ids` in `kwargs`) are recorded.
+
+        '''
+        frames = getattr(_local, 'suppressions', None)
+        if not frames:
+            return False
+        senderkey = _make_model_id(sender)
+        for signals, senderkeys, collected in reversed(frames):
+            if signals and self not in signals:
+                continue
+            if senderkeys is not None and senderkey not in senderkeys:
+                continue
+            if collected is not None:
+                ids = collected.setdefault(self, {}).setdefault(senderkey,
+                                                                set())
+                ids.update(getattr(sender, 'ids', ()))
+                result = kwargs.get('result')
+                if isinstance(result, models.BaseModel):
+                    ids.update(result.ids)
+                ids.update(kwargs.get('ids', ()))
+            return True
+        return False
+
+    def _live_receivers(self, sender, values=None):
         """Filter sequence of receivers to get resolved, live receivers.
 
+        If `values` is not None, receivers declaring the `fields` they are
+        interested in are only included if any of those is in `values`.
+
         """
+        if self._dead:
+            with self._lock:
+                self._prune()
         if isinstance(sender, models.Model):
             registry_ready = sender.pool.ready
         else:
             registry_ready = False
-        senderkey = _make_model_id(sender)
-        receivers = []
-        for (receiverkey, r_senderkey), receiver in self.receivers:
-            if self._installed(sender, receiver) and not r_senderkey or r_senderkey == senderkey:
-                if registry_ready or not receiver.require_registry:
-                    receivers.append(receiver)
-        return receivers
+        dispatch = self._dispatch
+        try:
+            candidates = dispatch.get(_make_model_id(sender))
+        except TypeError:
+            # Unhashable senders only get the receivers for any sender.
+            candidates = None
+        if candidates is None:
+            candidates = dispatch.get(None, ())
+        return [
+            receiver
+            for receiver in candidates
+            if (registry_ready or not receiver.require_registry) and
+            _interested(receiver, values) and
+            self._installed(sender, receiver)
+        ]
 
     def _installed(self, sender, receiver):
         '''Return True if the receiver is defined in a module installed in
@@ -205,38 +509,308 @@ class Signal(object):
         framework.)
 
         '''
-        from xoeuf.modules import get_object_module
-        module = get_object_module(receiver, typed=True)
+        module = receiver.module
         env = getattr(sender, 'env', None)
         if module and env:
-            mm = env['ir.module.module']
-            query = [('state', '=', 'installed'), ('name', '=', module)]
-            return bool(mm.search(query))
+            return module in _get_installed_addons(env)
         else:
             return True
 
 
+# The cache of installed addons per database.  Maps a DB name to a pair of
+# `(registry_ref, addons)`, where `registry_ref` is a weak reference to the
+# registry the cache was built for, and `addons` is a frozenset with the names
+# of the installed addons.  Installing, upgrading or uninstalling addons
+# creates a new registry, which renders the entry stale.
+_installed_addons = {}
+
+
+def _get_installed_addons(env):
+    '''Return the names of the addons installed in `env`'s database.
+
+    The result is cached per registry, but only once the registry is ready;
+    while loading, the addons' states are being changed.
+
+    '''
+    registry = env.registry
+    dbname = env.cr.dbname
+    cached = _installed_addons.get(dbname)
+    if cached and cached[0]() is registry:
+        return cached[1]
+    env.cr.execute(
+        "SELECT name FROM ir_module_module WHERE state = 'installed'"
+    )
+    result = frozenset(name for name, in env.cr.fetchall())
+    if registry.ready:
+        _installed_addons[dbname] = (_weakref(registry), result)
+    return result
+
+
+def _invalidate_installed_addons(dbname):
+    _installed_addons.pop(dbname, None)
+
+
+# **************INSTRUMENTATION****************
+_instrumented = False
+_slow_threshold = None
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class _ReceiverStats(object):
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = self.max = 0.0
+
+
+def instrument_receivers(enabled=True, threshold=None):
+    '''Enable (or disable) the timing of receivers.
+
+    While enabled, every call to a receiver is timed and accounted per
+    signal, receiver and sender.  See `get_receivers_stats`:func:.
+
+    :param threshold: If not None, log a warning for every call to a
+           receiver that takes longer than these many milliseconds.
+
+    '''
+    global _instrumented, _slow_threshold
+    _slow_threshold = threshold
+    _instrumented = enabled
+
+
+def reset_receivers_stats():
+    '''Forget the timings collected so far.'''
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_receivers_stats():
+    '''Return the timings of receivers collected so far.
+
+    Return a list of dictionaries with keys 'signal', 'receiver', 'sender',
+    'calls', 'total' and 'max' (times in milliseconds), sorted by 'total'
+    (slowest first).
+
+    '''
+    from xoutil.names import nameof
+    with _stats_lock:
+        items = list(_stats.items())
+    result = [
+        dict(signal=_signal_name(signal),
+             receiver=nameof(receiver.receiver, inner=True, full=True),
+             sender=senderkey if senderkey is None else str(senderkey),
+             calls=stats.calls,
+             total=stats.total * 1000,
+             max=stats.max * 1000)
+        for (signal, receiver, senderkey), stats in items
+    ]
+    result.sort(key=lambda item: item['total'], reverse=True)
+    return result
+
+
+def receivers_report():
+    '''Return a text report of `get_receivers_stats`:func:.'''
+    lines = ['%10s %12s %10s  %s' % ('calls', 'total (ms)', 'max (ms)',
+                                     'signal / sender / receiver')]
+    for item in get_receivers_stats():
+        lines.append('%(calls)10d %(total)12.2f %(max)10.2f  '
+                     '%(signal)s / %(sender)s / %(receiver)s' % item)
+    return '\n'.join(lines)
+
+
+def _signal_name(signal):
+    name = getattr(signal, 'name', None)
+    if not name:
+        name = next((key for key, value in globals().items()
+                     if value is signal), repr(signal))
+    return name
+
+
+def _timed_call(signal, receiver, sender, kwargs):
+    start = _timer()
+    try:
+        return receiver(sender, signal=signal, **kwargs)
+    finally:
+        elapsed = _timer() - start
+        senderkey = _make_model_id(sender)
+        try:
+            hash(senderkey)
+        except TypeError:
+            # Unhashable senders are accounted as any sender, as they are
+            # dispatched.
+            senderkey = None
+        key = (signal, receiver, senderkey)
+        with _stats_lock:
+            stats = _stats.get(key)
+            if stats is None:
+                stats = _stats[key] = _ReceiverStats()
+            stats.calls += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+        threshold = _slow_threshold
+        if threshold is not None and elapsed * 1000 > threshold:
+            logger.warning(
+                'Slow receiver %r for %s from %s: %.1f ms (%d records)',
+                receiver.receiver, _signal_name(signal), senderkey,
+                elapsed * 1000, len(getattr(sender, 'ids', ()))
+            )
+
+
+# Holds the frames of `suppressed` of the current thread.
+_local = threading.local()
+
+
+@contextmanager
+def suppressed(*signals, **kwargs):
+    '''Suppress the dispatch of `signals` in the current thread.
+
+    If no signal is given, all signals are suppressed.  Lists of signals
+    (e.g `post_save`:obj:) may be given as well.
+
+    :keyword models: The models (or model names) whose signals are
+             suppressed.  If None (the default), the signals are suppressed
+             for every sender.
+
+    :keyword collect: If True, the ids of the suppressed senders are
+             collected in a dictionary ``{signal: {model name: set(ids)}}``.
+
+    :keyword callback: A callable to be called with the collected ids after
+             the block (only if no error is raised).  Implies `collect`.
+
+    Yields the dictionary of collected ids (or None if not collecting)::
+
+        >>> with suppressed(pre_write, post_write, models=['res.partner'],
+        ...                 callback=reindex_partners):  # doctest: +SKIP
+        ...     backfill_partners()
+
+    '''
+    models_ = kwargs.get('models', None)
+    callback = kwargs.get('callback', None)
+    collect = kwargs.get('collect', False) or callback is not None
+    if models_ is not None:
+        if not isinstance(models_, (list, tuple, set, frozenset)):
+            models_ = [models_]
+        models_ = frozenset(_make_model_id(m) for m in models_)
+    flattened = []
+    for signal in signals:
+        if isinstance(signal, (list, tuple)):
+            flattened.extend(signal)
+        else:
+            flattened.append(signal)
+    collected = {} if collect else None
+    frames = getattr(_local, 'suppressions', None)
+    if frames is None:
+        frames = _local.suppressions = []
+    frames.append((frozenset(flattened), models_, collected))
+    try:
+        yield collected
+    finally:
+        frames.pop()
+    if callback is not None:
+        callback(collected)
+
+
+def _interested(receiver, values):
+    '''Return True if the `receiver` cares about the `values` being sent.'''
+    fields = receiver.fields
+    return not fields or values is None or not fields.isdisjoint(values)
+
+
 class Receiver(object):
-    '''Wraps a receiver, so that we can store some metadata.'''
-    def __init__(self, receiver, **kwargs):
-        from xoutil.objects import smart_copy
-        self.receiver = receiver
-        smart_copy(
-            kwargs,
-            self.__dict__,
-            defaults={'require_registry': True, }
-        )
+    '''Wraps a receiver, so that we can store some metadata.
+
+    If `weak` is True, only a weak reference to the receiver is kept (if the
+    receiver supports it), and `on_dead` is called once it is garbage
+    collected.
+
+    '''
+    __slots__ = ('_ref', '_hash', 'senderkey', 'require_registry', 'fields',
+                 'coalesce', 'concurrent', 'cacheable', 'module')
+
+    def __init__(self, receiver, senderkey=None, require_registry=True,
+                 fields=None, coalesce=False, concurrent=False, weak=False,
+                 cacheable=False, on_dead=None):
+        from xoeuf.modules import get_object_module
+        self._hash = hash(receiver)
+        self._ref = _make_ref(receiver, on_dead) if weak else _strong(receiver)
+        self.senderkey = senderkey
+        self.require_registry = require_registry
+        if fields is not None:
+            from xoutil.eight import string_types
+            if isinstance(fields, string_types):
+                fields = [fields]
+            fields = frozenset(fields)
+        self.fields = fields
+        self.coalesce = coalesce
+        self.concurrent = concurrent
+        self.cacheable = cacheable
+        # Computed once, this is checked in every dispatch.
+        self.module = get_object_module(receiver, typed=True)
+
+    @property
+    def receiver(self):
+        '''The wrapped receiver or None if it was garbage collected.'''
+        return self._ref()
+
+    @property
+    def dead(self):
+        return self._ref() is None
 
     def __call__(self, *args, **kwargs):
-        return self.receiver(*args, **kwargs)
+        receiver = self._ref()
+        if receiver is not None:
+            return receiver(*args, **kwargs)
 
     # So that the original receiver compares equal to this wrapper.
     def __hash__(self):
-        return hash(self.receiver)
+        return self._hash
 
     def __eq__(self, other):
+        if isinstance(other, Receiver):
+            other = other.receiver
         return self.receiver == other
 
+    def __ne__(self, other):
+        return not (self == other)
+
+
+def _strong(target):
+    return lambda: target
+
+
+class _WeakMethod(object):
+    '''A weak reference to a bound method.'''
+    __slots__ = ('_self', '_func')
+
+    def __init__(self, method, callback=None):
+        self._self = _weakref(method.__self__, callback)
+        self._func = method.__func__
+
+    def __call__(self):
+        obj = self._self()
+        if obj is not None:
+            return MethodType(self._func, obj)
+
+
+def _make_ref(target, callback=None):
+    '''Return a weak reference to `target`.
+
+    Bound methods are referenced through their instance.  If `target` can't
+    be weakly referenced, return a strong reference.
+
+    '''
+    try:
+        if getattr(target, '__self__', None) is not None and \
+           hasattr(target, '__func__'):
+            return _WeakMethod(target, callback)
+        else:
+            return _weakref(target, callback)
+    except TypeError:
+        return _strong(target)
+
 
 def receiver(signal, **kwargs):
     """A decorator for connecting receivers to signals.
@@ -246,6 +820,15 @@ def receiver(signal, **kwargs):
     :keyword require_registry: If set to True the receiver will only be called
              if the Odoo DB registry is ready.
 
+    :keyword fields: The names of the fields the receiver is interested in.
+             See `Signal.connect`:meth:.
+
+    :keyword weak: If True, the signal only keeps a weak reference to the
+             receiver.  The default is False.  See `Signal.connect`:meth:.
+
+    :keyword concurrent: If True, `~Signal.safe_send`:meth: calls the
+             receiver in a pool of threads.  See `Signal.connect`:meth:.
+
     Used by passing in the signal (or list of signals) and keyword arguments
     to connect::
 
@@ -257,6 +840,10 @@ def receiver(signal, **kwargs):
         def signals_receiver(sender, **kwargs):
             ...
 
+        @receiver(post_write, sender='my.model', fields=['state'])
+        def state_changed(sender, values=None, **kwargs):
+            ...
+
     """
     def _decorator(func):
         if isinstance(signal, (list, tuple)):
@@ -293,6 +880,738 @@ def filtered(*predicates):
     return decorator
 
 
+def filtered_domain(domain):
+    '''Allow to decorate receivers to get only the records matching `domain`.
+
+    The receiver is called with the records of the sender (or of the `result`
+    if it's a recordset, as in `post_create`:obj:) that match the `domain`.
+    If no record matches, the receiver is not called.
+
+    Signals whose sender is an empty recordset or deleted records (namely
+    `pre_create`:obj:, `pre_create_multi`:obj:, `pre_fields_view_get`:obj:,
+    `post_fields_view_get`:obj:, `post_unlink`:obj:,
+    `post_commit_unlink`:obj:, `outbox_unlink`:obj: and
+    `remote_post_save`:obj:) have no records to filter, so connecting the
+    decorated receiver to them raises a ValueError.
+
+    The domain is evaluated for all the records at once: in memory if every
+    leaf compares a simple stored field whose values are in the cache,
+    otherwise with a single search (as superuser and including inactive
+    records).
+
+    Usage::
+
+        >>> @receiver(post_write, sender='res.partner')  # doctest: +SKIP
+        ... @filtered_domain([('customer', '=', True)])
+        ... def handler(self, **kwargs):
+        ...     pass
+
+    '''
+    domain = list(domain)
+
+    def decorator(func):
+        from functools import wraps
+
+        @wraps(func)
+        def inner(self, **kwargs):
+            result = kwargs.get('result')
+            if isinstance(result, models.BaseModel):
+                matching = _filter_by_domain(result, domain)
+                if matching:
+                    return func(self, **dict(kwargs, result=matching))
+            elif isinstance(self, models.BaseModel):
+                matching = _filter_by_domain(self, domain)
+                if matching:
+                    return func(matching, **kwargs)
+            else:
+                return func(self, **kwargs)
+        inner._filtered_domain = domain
+        return inner
+    return decorator
+
+
+def _get_domain(receiver):
+    '''Return the domain given to `filtered_domain`:func: for `receiver`.
+
+    Return None if the receiver is not filtered by domain.
+
+    '''
+    return getattr(receiver, '_filtered_domain', None)
+
+
+def _filter_by_domain(records, domain):
+    '''Return the `records` that match `domain` (keeping their order).'''
+    if not records:
+        return records
+    found = _match_in_cache(records, domain)
+    if found is None:
+        query = [('id', 'in', records.ids)] + domain
+        Model = records.sudo().with_context(active_test=False)
+        found = set(Model.search(query).ids)
+    return records.browse([id for id in records.ids if id in found])
+
+
+_CACHE_COMPARABLE_TYPES = ('char', 'text', 'selection', 'integer', 'float',
+                           'boolean', 'date', 'datetime')
+
+
+def _match_in_cache(records, domain):
+    '''Evaluate `domain` for `records` with the values in the cache.
+
+    Return the set of matching ids, or None if the domain can't be evaluated
+    in memory.
+
+    '''
+    from xoutil.eight import string_types, integer_types
+    try:
+        from openerp.osv.expression import normalize_domain
+    except ImportError:
+        from odoo.osv.expression import normalize_domain
+    simple = string_types + integer_types + (float, bool)
+    cache = records.env.cache
+    ids = set(records.ids)
+    stack = []
+    for token in reversed(normalize_domain(domain)):
+        if token == '&':
+            stack.append(stack.pop() & stack.pop())
+        elif token == '|':
+            stack.append(stack.pop() | stack.pop())
+        elif token == '!':
+            stack.append(ids - stack.pop())
+        else:
+            fname, op, value = token
+            field = records._fields.get(fname)
+            if field is None or not field.store or \
+               field.type not in _CACHE_COMPARABLE_TYPES:
+                return None
+            values = cache.get(field, {})
+            if op in ('in', 'not in'):
+                value = set(value)
+                test = (lambda v: v in value) if op == 'in' else \
+                    (lambda v: v not in value)
+            elif op in ('=', '!='):
+                test = (lambda v: v == value) if op == '=' else \
+                    (lambda v: v != value)
+            else:
+                return None
+            matching = set()
+            for id in ids:
+                v = values.get(id, ids)  # ids as a sentinel
+                if v is False or isinstance(v, simple):
+                    if test(v):
+                        matching.add(id)
+                else:
+                    return None
+            stack.append(matching)
+    return stack.pop() if stack else ids
+
+
+class PostCommitSignal(Signal):
+    '''A signal delivered after the transaction of the sender commits.
+
+    Receivers are called in a pool of worker threads, each with a cursor of
+    its own, so they don't extend the sender's transaction.  If the sender's
+    transaction is rolled back, the signal is not delivered.
+
+    The size of the pool is taken from the option
+    ``signals_post_commit_workers`` (default 2) of the Odoo configuration.
+    The option ``signals_post_commit_queue_size`` (default 1024) bounds the
+    number of signals waiting to be delivered; signals beyond that are
+    dropped and logged.
+
+    .. note:: Signals issued within a savepoint are delivered even if the
+       savepoint is rolled back (but the transaction is committed).
+
+    '''
+    def send_on_commit(self, sender, **kwargs):
+        '''Send the signal once the transaction of `sender` is committed.
+
+        :param sender: A recordset.  Receivers get a recordset for the same
+               model and ids, in an environment with the same user and
+               context but a different cursor.
+
+        All keyword arguments are passed to receivers.
+
+        '''
+        if not self.has_listeners(sender) or self._suppressed(sender, kwargs):
+            return
+        env = sender.env
+        event = (env.cr.dbname, env.uid, dict(env.context),
+                 sender._name, tuple(sender.ids), kwargs)
+        hooks = _get_transaction_hooks(env.cr)
+        hooks.postcommit.append(partial(self._submit, event))
+
+    def _submit(self, event):
+        pool = _get_post_commit_pool()
+        if not pool.submit(self._deliver, *event):
+            dbname, _, _, model, ids, _ = event
+            logger.warning(
+                'Dropping post-commit signal for %s%r in %s: queue is full',
+                model, ids, dbname
+            )
+
+    def _deliver(self, dbname, uid, context, model, ids, kwargs):
+        from xoeuf.modules import _get_registry
+        registry = _get_registry(dbname)
+        with api.Environment.manage():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                self.safe_send(env[model].browse(ids), **kwargs)
+
+
+class OutboxSignal(Signal):
+    '''A signal stored in a table and delivered by a separate process.
+
+    The signal is written to the table ``xoeuf_signals_outbox`` in the same
+    transaction of the sender; so it's stored only if the transaction is
+    committed.  The command ``xoeuf outbox`` delivers the stored signals
+    (see `drain_outbox`:func:).  Delivery is at-least-once: if a receiver
+    fails, the signal is retried later and other receivers may be called
+    again.
+
+    Arguments must be serializable to JSON.  The `name` identifies the signal
+    in the table and must be unique.
+
+    '''
+    def __init__(self, name, action=None, doc=None):
+        super(OutboxSignal, self).__init__(action=action, doc=doc)
+        assert name not in _outbox_signals, \
+            'Duplicated outbox signal %r' % name
+        self.name = name
+        _outbox_signals[name] = self
+
+    def send_to_outbox(self, sender, **kwargs):
+        '''Store the signal in the outbox of the sender's DB.
+
+        :param sender: A recordset.  Receivers get a recordset for the same
+               model and ids, in an environment with the same user and
+               context.
+
+        All keyword arguments are passed to receivers.
+
+        '''
+        if not self.has_listeners(sender) or self._suppressed(sender, kwargs):
+            return
+        env = sender.env
+        _ensure_outbox(env.cr)
+        env.cr.execute(
+            '''INSERT INTO xoeuf_signals_outbox
+               (signal, model, res_ids, uid, context, kwargs)
+               VALUES (%s, %s, %s, %s, %s, %s)''',
+            (self.name, sender._name, json.dumps(sender.ids), env.uid,
+             json.dumps(dict(env.context), default=str),
+             json.dumps(kwargs, default=str))
+        )
+
+
+# The outbox signals by name.
+_outbox_signals = {}
+
+# The DBs where the outbox table is known to exist.
+_outbox_dbs = set()
+
+
+def _ensure_outbox(cr):
+    '''Make sure the outbox table exists in the DB of `cr`.
+
+    The table is created with a cursor of its own which is committed right
+    away, so that a rollback of `cr` doesn't undo it.  The DB is only
+    remembered once the table is known to be committed.
+
+    '''
+    dbname = cr.dbname
+    if dbname in _outbox_dbs:
+        return
+    import psycopg2
+    with closing(sql_db.db_connect(dbname).cursor()) as own:
+        try:
+            own.execute('''
+            CREATE TABLE IF NOT EXISTS xoeuf_signals_outbox (
+                id SERIAL PRIMARY KEY,
+                signal VARCHAR NOT NULL,
+                model VARCHAR NOT NULL,
+                res_ids TEXT NOT NULL,
+                uid INTEGER,
+                context TEXT,
+                kwargs TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                create_date TIMESTAMP DEFAULT (now() at time zone 'UTC')
+            )
+            ''', log_exceptions=False)
+            own.commit()
+        except psycopg2.Error:
+            # Another process created it at the same time.
+            own.rollback()
+        own.execute(
+            "SELECT 1 FROM pg_class WHERE relname = 'xoeuf_signals_outbox'"
+        )
+        exists = own.fetchone()
+    if exists:
+        _outbox_dbs.add(dbname)
+
+
+def drain_outbox(cr, limit=100, max_attempts=5):
+    '''Deliver up to `limit` signals stored in the outbox of `cr`'s DB.
+
+    The signals are locked with ``FOR UPDATE SKIP LOCKED``, so several
+    processes can drain the same outbox.  Each signal is sent within a
+    savepoint; delivered signals are deleted from the outbox.  If any
+    receiver fails, the savepoint is rolled back and the signal is retried
+    in later calls until it fails `max_attempts` times.
+
+    The caller must commit the cursor and manage the environments (see
+    `xoeuf.api.contextual`:func:).  Requires PostgreSQL 9.5 or later.
+
+    Return the number of signals processed (delivered or not).
+
+    '''
+    _ensure_outbox(cr)
+    cr.execute(
+        '''SELECT id, signal, model, res_ids, uid, context, kwargs
+           FROM xoeuf_signals_outbox
+           WHERE attempts < %s
+           ORDER BY id
+           LIMIT %s
+           FOR UPDATE SKIP LOCKED''',
+        (max_attempts, limit)
+    )
+    rows = cr.fetchall()
+    delivered = []
+    for outbox_id, name, model, res_ids, uid, context, kwargs in rows:
+        signal = _outbox_signals.get(name)
+        try:
+            if signal is None:
+                raise LookupError('Unknown outbox signal %r' % name)
+            env = api.Environment(cr, uid, json.loads(context or '{}'))
+            with cr.savepoint():
+                signal.send(env[model].browse(json.loads(res_ids)),
+                            **json.loads(kwargs or '{}'))
+        except Exception as error:
+            logger.exception('Error delivering outbox signal %s', outbox_id)
+            cr.execute(
+                '''UPDATE xoeuf_signals_outbox
+                   SET attempts = attempts + 1, error = %s
+                   WHERE id = %s''',
+                (repr(error), outbox_id)
+            )
+        else:
+            delivered.append(outbox_id)
+    if delivered:
+        cr.execute('DELETE FROM xoeuf_signals_outbox WHERE id IN %s',
+                   (tuple(delivered), ))
+    return len(rows)
+
+
+class _TransactionHooks(object):
+    '''The callables to run around the commit of a cursor.
+
+    `coalesced` holds the signals of `coalesced receivers <_coalesce>`:func:
+    waiting to be flushed; `flushed` the ids already flushed per receiver.
+    `remote` holds the changes to be notified to other processes (see
+    `_queue_remote`:func:).
+
+    '''
+    __slots__ = ('precommit', 'postcommit', 'coalesced', 'flushed', 'remote')
+
+    def __init__(self):
+        self.precommit = []
+        self.postcommit = []
+        self.coalesced = None
+        self.flushed = None
+        self.remote = None
+
+
+def _get_transaction_hooks(cr):
+    '''Get the hooks of the current transaction of `cr`.
+
+    The hooks are discarded when the transaction is rolled back.
+
+    '''
+    # Cursor.__getattr__ delegates to the psycopg2 cursor, so don't use
+    # getattr.
+    hooks = cr.__dict__.get('_xoeuf_hooks')
+    if hooks is None:
+        hooks = cr.__dict__['_xoeuf_hooks'] = _TransactionHooks()
+    return hooks
+
+
+def _coalesce(signal, receiver, sender, kwargs):
+    '''Delay the call to `receiver` until the transaction is committed.
+
+    Return False if `sender` is not a recordset (and the receiver must be
+    called right away).
+
+    '''
+    env = getattr(sender, 'env', None)
+    if env is None or not isinstance(sender, models.BaseModel):
+        return False
+    hooks = _get_transaction_hooks(env.cr)
+    if hooks.coalesced is None:
+        hooks.coalesced = {}
+        hooks.precommit.append(partial(_flush_coalesced, hooks))
+    key = (signal, receiver, sender._name)
+    _, pending = hooks.coalesced.get(key, (None, {}))
+    values = kwargs.get('values') or {}
+    for id in sender.ids:
+        pending.setdefault(id, {}).update(values)
+    hooks.coalesced[key] = (env, pending)
+    return True
+
+
+def _flush_coalesced(hooks):
+    coalesced, hooks.coalesced = hooks.coalesced, None
+    if hooks.flushed is None:
+        hooks.flushed = {}
+    for key, (env, pending) in coalesced.items():
+        signal, receiver, model = key
+        # Records written by the receiver (or by later pre-commit hooks)
+        # are coalesced again; don't call the receiver again for them, or
+        # it may never end.
+        flushed = hooks.flushed.setdefault(key, set())
+        # Group the records with the same values.
+        groups = OrderedDict()
+        for id, values in pending.items():
+            if id not in flushed:
+                flushed.add(id)
+                group = groups.setdefault(_values_key(values), (values, []))
+                group[1].append(id)
+        for values, ids in groups.values():
+            try:
+                records = env[model].browse(ids).exists()
+                if records:
+                    receiver(records, signal=signal, result=True,
+                             values=values)
+            except Exception:
+                logger.exception('Error in coalesced receiver %r',
+                                 receiver.receiver)
+
+
+def _values_key(values):
+    '''Return a hashable key for the dict `values`.'''
+    try:
+        result = frozenset(values.items())
+        hash(result)
+    except TypeError:
+        # Unhashable values (e.g x2many commands)
+        result = repr(sorted(values.items()))
+    return result
+
+
+# **************REMOTE SIGNALS****************
+# The channel of the notifications of changes.
+REMOTE_CHANNEL = 'xoeuf_signals'
+
+# PostgreSQL rejects payloads of 8000 bytes or more.
+_MAX_PAYLOAD = 7900
+
+# Identifies the notifications of this process (with its pid).
+_ORIGIN = uuid.uuid4().hex
+
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+def _queue_remote(records, action, fields=()):
+    '''Queue the notification of changes in `records` to other processes.
+
+    The notification is sent before commit (NOTIFY is only delivered if the
+    transaction commits).  Changes to the same model are sent together.
+
+    '''
+    if not remote_post_save.has_listeners(records) or not records:
+        return
+    hooks = _get_transaction_hooks(records.env.cr)
+    if hooks.remote is None:
+        hooks.remote = {}
+        hooks.precommit.append(partial(_notify_remote, records.env.cr,
+                                       hooks))
+    ids, fnames = hooks.remote.setdefault((records._name, action),
+                                          (set(), set()))
+    ids.update(records.ids)
+    fnames.update(fields)
+
+
+def _notify_remote(cr, hooks):
+    pending, hooks.remote = hooks.remote, None
+    origin = '%s:%d' % (_ORIGIN, os.getpid())
+    for (model, action), (ids, fnames) in pending.items():
+        fields = sorted(fnames)
+        # If the names of the fields leave too little room for the ids,
+        # notify the fields as unknown.  Otherwise, we'd end up sending
+        # a notification per id.
+        empty = json.dumps(dict(origin=origin, model=model, action=action,
+                                ids=[], fields=fields))
+        if len(empty) > _MAX_PAYLOAD // 2:
+            fields = None
+        chunks = [sorted(ids)]
+        while chunks:
+            chunk = chunks.pop()
+            payload = json.dumps(dict(origin=origin, model=model,
+                                      action=action, ids=chunk,
+                                      fields=fields))
+            if len(payload) <= _MAX_PAYLOAD:
+                cr.execute('SELECT pg_notify(%s, %s)',
+                           (REMOTE_CHANNEL, payload))
+            elif len(chunk) > 1:
+                half = len(chunk) // 2
+                chunks.extend([chunk[:half], chunk[half:]])
+            else:
+                logger.error('Cannot notify the change of %s to other '
+                             'processes: %r', model, chunk)
+
+
+def listen_remote_signals(dbname):
+    '''Start (if needed) the thread that emits `remote_post_save`:obj:.
+
+    The thread listens the notifications of changes made by other processes
+    in the DB `dbname`.  This is done automatically the first time a cursor
+    for the DB is requested to the registry while `remote_post_save`:obj:
+    has receivers.
+
+    '''
+    pid = os.getpid()
+    if _listeners.get(dbname) == pid:
+        return
+    with _listeners_lock:
+        if _listeners.get(dbname) != pid:
+            thread = threading.Thread(
+                name='xoeuf.signals.remote.%s' % dbname,
+                target=_listen_remote,
+                args=(dbname, )
+            )
+            thread.daemon = True
+            thread.start()
+            _listeners[dbname] = pid
+
+
+def _listen_remote(dbname):
+    import time
+    import select
+    while True:
+        try:
+            with sql_db.db_connect(dbname).cursor() as cr:
+                conn = cr._cnx
+                cr.execute('LISTEN %s' % REMOTE_CHANNEL)
+                cr.commit()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    payloads = []
+                    while conn.notifies:
+                        payloads.append(conn.notifies.pop(0).payload)
+                    try:
+                        _emit_remote(dbname, payloads)
+                    except Exception:
+                        # Keep listening, the connection is fine.
+                        logger.exception('Error emitting remote signals '
+                                         'in %s', dbname)
+        except Exception:
+            logger.exception('Error listening remote signals in %s', dbname)
+            time.sleep(10)
+
+
+def _emit_remote(dbname, payloads):
+    from xoeuf.modules import _get_registry
+    try:
+        from openerp import SUPERUSER_ID
+    except ImportError:
+        from odoo import SUPERUSER_ID
+    origin = '%s:%d' % (_ORIGIN, os.getpid())
+    registry = _get_registry(dbname)
+    with api.Environment.manage():
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            for payload in payloads:
+                event = json.loads(payload)
+                model = event['model']
+                if event['origin'] == origin or model not in env.registry:
+                    continue
+                remote_post_save.safe_send(env[model].browse(event['ids']),
+                                           action=event['action'],
+                                           fields=event['fields'])
+
+
+class _WorkerPool(object):
+    '''A pool of daemon threads with a bounded queue of tasks.
+
+    Threads are (re)started lazily, so that a pool created before forking
+    works in the children.
+
+    '''
+    def __init__(self, name, size, maxsize=0):
+        self.name = name
+        self.size = size
+        self.maxsize = maxsize
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        '''Queue `func` to be called in a thread of the pool.
+
+        Return False if the queue is full and the call was dropped.
+
+        '''
+        queue = self._ensure_started()
+        try:
+            queue.put_nowait((func, args, kwargs))
+        except Full:
+            return False
+        else:
+            return True
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = Queue(self.maxsize)
+                    for i in range(self.size):
+                        thread = threading.Thread(
+                            name='%s-%d' % (self.name, i),
+                            target=self._work,
+                            args=(self._queue, )
+                        )
+                        thread.daemon = True
+                        thread.start()
+                    self._pid = pid
+        return self._queue
+
+    def _work(self, queue):
+        while True:
+            func, args, kwargs = queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('Error in %s', self.name)
+            finally:
+                queue.task_done()
+
+
+def _run_concurrently(signal, receivers, sender, kwargs):
+    '''Call the `receivers` in the pool of concurrent receivers.
+
+    Return a list of `(receiver, response, error)`.
+
+    '''
+    pool = _get_concurrent_pool()
+    results, events = [], []
+    for receiver in receivers:
+        result, done = [receiver, None, None], threading.Event()
+        task = partial(_call_concurrently, signal, result, done, sender,
+                       kwargs)
+        # Avoid a dead-lock when the pool is full or we're in the pool.
+        if getattr(_local, 'concurrent', False) or \
+                not pool.submit(partial(task, pooled=True)):
+            task()
+        results.append(result)
+        events.append(done)
+    for done in events:
+        done.wait()
+    return results
+
+
+def _call_concurrently(signal, result, done, sender, kwargs, pooled=False):
+    '''Call the receiver in `result` and store its response or error.
+
+    `done` is set once finished, whatever happens.  If `pooled` is True,
+    we're in a thread of the pool and the cursor of the thread is used.
+    Otherwise, a new cursor is used and closed afterwards.
+
+    '''
+    try:
+        _call_receiver_concurrently(signal, result, sender, kwargs, pooled)
+    finally:
+        done.set()
+
+
+def _call_receiver_concurrently(signal, result, sender, kwargs, pooled):
+    receiver = result[0]
+    concurrent, _local.concurrent = getattr(_local, 'concurrent', False), True
+    try:
+        if isinstance(sender, models.BaseModel):
+            env = sender.env
+            with api.Environment.manage():
+                if pooled:
+                    cr = _get_thread_cursor(env.registry)
+                else:
+                    cr = env.registry.cursor()
+                try:
+                    env = api.Environment(cr, env.uid, env.context)
+                    kwargs = {
+                        key: (value.with_env(env)
+                              if isinstance(value, models.BaseModel)
+                              else value)
+                        for key, value in kwargs.items()
+                    }
+                    result[1] = _call(signal, receiver, sender.with_env(env),
+                                      kwargs)
+                finally:
+                    cr.rollback()
+                    if not pooled:
+                        cr.close()
+        else:
+            result[1] = _call(signal, receiver, sender, kwargs)
+    except Exception as error:
+        error._exc_info = sys.exc_info()
+        result[2] = error
+    finally:
+        _local.concurrent = concurrent
+
+
+def _get_thread_cursor(registry):
+    '''Return the cursor of the current thread for the DB of `registry`.
+
+    The cursor is kept open for later calls in the same thread, so that the
+    threads of the pool don't open a connection per call.
+
+    '''
+    cursors = getattr(_local, 'cursors', None)
+    if cursors is None:
+        cursors = _local.cursors = {}
+    cr = cursors.get(registry.db_name)
+    # Cursor.__getattr__ delegates to the psycopg2 cursor, so don't use
+    # getattr.
+    if cr is None or cr.__dict__.get('_closed'):
+        cr = cursors[registry.db_name] = registry.cursor()
+    return cr
+
+
+def _call(signal, receiver, sender, kwargs):
+    if _instrumented:
+        return _timed_call(signal, receiver, sender, kwargs)
+    else:
+        return receiver(sender, signal=signal, **kwargs)
+
+
+_concurrent_pool = None
+
+
+def _get_concurrent_pool():
+    global _concurrent_pool
+    if _concurrent_pool is None:
+        size = int(config.get('signals_concurrent_workers', 4))
+        _concurrent_pool = _WorkerPool('xoeuf.signals.concurrent', size,
+                                       size * 16)
+    return _concurrent_pool
+
+
+_post_commit_pool = None
+
+
+def _get_post_commit_pool():
+    global _post_commit_pool
+    if _post_commit_pool is None:
+        _post_commit_pool = _WorkerPool(
+            'xoeuf.signals.post_commit',
+            int(config.get('signals_post_commit_workers', 2)),
+            int(config.get('signals_post_commit_queue_size', 1024))
+        )
+    return _post_commit_pool
+
+
 # **************SIGNALS DECLARATION****************
 pre_fields_view_get = Signal('fields_view_get')
 post_fields_view_get = Signal('fields_view_get')
@@ -332,6 +1651,43 @@ Arguments:
 :keyword values: The values passed to 'create'.
 ''')
 
+pre_create_multi = Signal('create', '''
+Signal sent when the 'create_multi' method is to be invoked.
+
+This is sent once for the whole batch, so that receivers can do set-based
+work.  'pre_create' is still sent for each record.
+
+If a receiver raises an error no record is created, and post_create_multi
+won't be issued.  The error is propagated.
+
+Arguments:
+
+:param sender: The recordset where the 'create_multi' was called.
+
+:keyword values_list: The list of values passed to 'create_multi'.
+
+''')
+
+post_create_multi = Signal('create', '''
+Signal sent when the 'create_multi' method has finished but before data is
+committed to the DB.
+
+This is sent once for the whole batch, so that receivers can do set-based
+work.  'post_create' is still sent for each record.
+
+If a receiver raises an error, is trapped and other receivers are allowed
+to run.  However if the error renders the cursor unusable, other receivers
+and the commit to DB may fail.
+
+Arguments:
+
+:param sender: The recordset where the 'create_multi' was called.
+
+:keyword result: The created records (in the order of `values_list`).
+:keyword values_list: The list of values passed to 'create_multi'.
+
+''')
+
 pre_write = Signal('write', '''
 Signal sent when the 'write' method of model is to be invoked.
 
@@ -391,8 +1747,134 @@ Arguments:
 
 ''')
 
+post_commit_create = PostCommitSignal('create', '''
+Signal sent after the transaction where records were created is committed.
+
+Receivers are called in a worker thread with a cursor of their own.  If the
+transaction is rolled back, no receiver is called.  See
+`PostCommitSignal`:class:.
+
+Arguments:
+
+:param sender: The created records.
+
+:keyword values: The values passed to 'create'.
+
+''')
+
+post_commit_write = PostCommitSignal('write', '''
+Signal sent after the transaction where records were written is committed.
+
+Receivers are called in a worker thread with a cursor of their own.  If the
+transaction is rolled back, no receiver is called.  See
+`PostCommitSignal`:class:.
+
+Arguments:
+
+:param sender: The written records.
+
+:keyword values: The values passed to the write method.
+
+''')
+
+post_commit_unlink = PostCommitSignal('unlink', '''
+Signal sent after the transaction where records were deleted is committed.
+
+Receivers are called in a worker thread with a cursor of their own.  If the
+transaction is rolled back, no receiver is called.  See
+`PostCommitSignal`:class:.
+
+Arguments:
+
+:param sender: An empty recordset of the model.
+
+:keyword ids: The ids of the deleted records.
+
+''')
+
+outbox_create = OutboxSignal('outbox_create', 'create', '''
+Signal stored in the outbox when records are created.
+
+Receivers are called by the command ``xoeuf outbox``.  See
+`OutboxSignal`:class:.
+
+Arguments:
+
+:param sender: The created records.
+
+:keyword values: The values passed to 'create'.
+
+''')
+
+outbox_write = OutboxSignal('outbox_write', 'write', '''
+Signal stored in the outbox when records are written.
+
+Receivers are called by the command ``xoeuf outbox``.  See
+`OutboxSignal`:class:.
+
+Arguments:
+
+:param sender: The written records.
+
+:keyword values: The values passed to the write method.
+
+''')
+
+outbox_unlink = OutboxSignal('outbox_unlink', 'unlink', '''
+Signal stored in the outbox when records are deleted.
+
+Receivers are called by the command ``xoeuf outbox``.  See
+`OutboxSignal`:class:.
+
+Arguments:
+
+:param sender: An empty recordset of the model.
+
+:keyword ids: The ids of the deleted records.
+
+''')
+
+remote_post_save = Signal(('create', 'write', 'unlink'), '''
+Signal sent when records are created, written or deleted by another process.
+
+Having receivers for this signal makes every process notify the changes to
+the models of the receivers (with PostgreSQL's NOTIFY, so only committed
+changes are notified) and listen to the notifications of others in a
+background thread (see `listen_remote_signals`:func:).  This is meant to
+keep process-local caches up to date.
+
+Receivers are called in the listening thread with a cursor of its own and
+the superuser.
+
+Arguments:
+
+:param sender: The changed records (deleted records no longer exist).
+
+:keyword action: Either 'create', 'write' or 'unlink'.
+
+:keyword fields: The names of the fields written (in the whole transaction).
+                 Empty for other actions.  None if they are too many to be
+                 notified (any field may have been written).
+
+''')
+
 pre_save = [pre_create, pre_write, pre_unlink]
 post_save = [post_create, post_write, post_unlink]
+post_commit_save = [post_commit_create, post_commit_write, post_commit_unlink]
+outbox_save = [outbox_create, outbox_write, outbox_unlink]
+
+# These signals are sent within the transaction of the sender.
+for _signal in [pre_fields_view_get, post_fields_view_get, pre_create_multi,
+                post_create_multi] + pre_save + post_save:
+    _signal.concurrent_receivers = False
+for _signal in [pre_fields_view_get, post_fields_view_get]:
+    _signal.cacheable_receivers = True
+# The sender of these signals has no records matching a domain.
+for _signal in [pre_fields_view_get, post_fields_view_get, pre_create,
+                pre_create_multi, post_unlink, post_commit_unlink,
+                outbox_unlink, remote_post_save]:
+    _signal.domain_receivers = False
+del _signal
 
 
 # **************SIGNALS SEND****************
@@ -405,44 +1887,192 @@ super_unlink = models.BaseModel.unlink
 @api.model
 def fields_view_get(self, view_id=None, view_type='form',
                     toolbar=False, submenu=False):
+    if not _has_receivers('fields_view_get', self):
+        return super(models.Model, self).fields_view_get(
+            view_id=view_id, view_type=view_type,
+            toolbar=toolbar, submenu=submenu
+        )
     kwargs = dict(
         view_id=view_id,
         view_type=view_type,
         toolbar=toolbar,
         submenu=submenu
     )
+    if self.pool.ready and _fields_view_get_cacheable(self):
+        cache = getattr(self.pool, 'cache', None)
+    else:
+        cache = None
+    if cache is not None:
+        key = _fields_view_get_key(self, **kwargs)
+        try:
+            return copy.deepcopy(cache[key])
+        except KeyError:
+            pass
     pre_fields_view_get.send(sender=self, **kwargs)
     result = super(models.Model, self).fields_view_get(**kwargs)
     post_fields_view_get.safe_send(sender=self, result=result, **kwargs)
+    if cache is not None:
+        cache[key] = copy.deepcopy(result)
     return result
 
 
+def _fields_view_get_cacheable(self):
+    '''Return True if all the receivers of 'fields_view_get' for the model
+    are cacheable.'''
+    receivers = (pre_fields_view_get._live_receivers(self) +
+                 post_fields_view_get._live_receivers(self))
+    return bool(receivers) and all(r.cacheable for r in receivers)
+
+
+# Context keys that don't affect the result of 'fields_view_get'.
+_VOLATILE_CONTEXT_KEYS = ('params', 'active_id', 'active_ids')
+
+
+def _fields_view_get_key(self, view_id, view_type, toolbar, submenu):
+    '''The key of the result of 'fields_view_get' in the registry cache.
+
+    The registry cache is cleared when views change (also in other
+    workers); a new registry is created when addons are installed or
+    removed.  The generation of the receivers covers connecting and
+    disconnecting receivers.
+
+    '''
+    context = tuple(sorted(
+        (key, repr(value))
+        for key, value in self.env.context.items()
+        if key not in _VOLATILE_CONTEXT_KEYS
+    ))
+    user = self.env.user
+    return (self._name, 'xoeuf.fields_view_get',
+            _generations.get('fields_view_get'),
+            view_id, view_type, bool(toolbar), bool(submenu),
+            tuple(sorted(user.groups_id.ids)), user.company_id.id, context)
+
+
 @api.model
 @api.returns('self', lambda value: value.id)
 def create(self, vals):
+    _invalidate_caches(self)
+    if not _has_receivers('create', self):
+        return super_create(self, vals)
     pre_create.send(sender=self, values=vals)
     res = super_create(self, vals)
     post_create.safe_send(sender=self, result=res, values=vals)
+    post_commit_create.send_on_commit(res, values=dict(vals))
+    outbox_create.send_to_outbox(res, values=vals)
+    _queue_remote(res, 'create')
+    return res
+
+
+@api.model
+@api.returns('self')
+def create_multi(self, vals_list):
+    '''Create a record for each item in `vals_list`.
+
+    Return the created records.  Sends `pre_create_multi`:obj: and
+    `post_create_multi`:obj: once for the whole batch.
+
+    '''
+    vals_list = list(vals_list)
+    if not _has_receivers('create', self):
+        return self.browse([self.create(vals).id for vals in vals_list])
+    pre_create_multi.send(sender=self, values_list=vals_list)
+    ids = [self.create(vals).id for vals in vals_list]
+    res = self.browse(ids)
+    post_create_multi.safe_send(sender=self, result=res,
+                                values_list=vals_list)
     return res
 
 
+def _invalidate_caches(self, vals=None):
+    '''Invalidate our caches when `self` is a model they depend upon.'''
+    if self._name == 'ir.module.module':
+        if vals is None or 'state' in vals:
+            _invalidate_installed_addons(self.env.cr.dbname)
+    elif self._name == 'ir.ui.view':
+        # The results of 'fields_view_get' are kept in the registry cache.
+        self.clear_caches()
+
+
 @api.multi
 def write(self, vals):
+    _invalidate_caches(self, vals)
+    if not _has_receivers('write', self):
+        return super_write(self, vals)
     pre_write.send(self, values=vals)
     res = super_write(self, vals)
     post_write.safe_send(self, result=res, values=vals)
+    post_commit_write.send_on_commit(self, values=dict(vals))
+    outbox_write.send_to_outbox(self, values=vals)
+    _queue_remote(self, 'write', vals)
     return res
 
 
 @api.multi
 def unlink(self):
+    _invalidate_caches(self)
+    if not _has_receivers('unlink', self):
+        return super_unlink(self)
     pre_unlink.send(self)
+    ids = self.ids
     res = super_unlink(self)
     post_unlink.safe_send(self, result=res)
+    post_commit_unlink.send_on_commit(self.browse(), ids=ids)
+    outbox_unlink.send_to_outbox(self.browse(), ids=ids)
+    _queue_remote(self, 'unlink')
     return res
 
 
 models.Model.fields_view_get = fields_view_get
 models.BaseModel.create = create
+models.BaseModel.create_multi = create_multi
 models.BaseModel.write = write
 models.BaseModel.unlink = unlink
+
+
+# **************TRANSACTION HOOKS****************
+_super_commit = sql_db.Cursor.commit
+_super_rollback = sql_db.Cursor.rollback
+
+
+def _commit(self):
+    hooks = self.__dict__.get('_xoeuf_hooks')
+    if hooks is not None:
+        # Pre-commit hooks may add hooks of any kind.
+        while hooks.precommit:
+            hooks.precommit.pop(0)()
+        del self.__dict__['_xoeuf_hooks']
+    result = _super_commit(self)
+    if hooks is not None:
+        for hook in hooks.postcommit:
+            try:
+                hook()
+            except Exception:
+                logger.exception('Error in post-commit hook %r', hook)
+    return result
+
+
+def _rollback(self):
+    self.__dict__.pop('_xoeuf_hooks', None)
+    return _super_rollback(self)
+
+
+sql_db.Cursor.commit = _commit
+sql_db.Cursor.rollback = _rollback
+
+
+try:
+    from openerp.modules.registry import Registry as _Registry
+except ImportError:
+    from odoo.modules.registry import Registry as _Registry
+
+_super_registry_cursor = _Registry.cursor
+
+
+def _registry_cursor(self, *args, **kwargs):
+    if remote_post_save.receivers:
+        listen_remote_signals(self.db_name)
+    return _super_registry_cursor(self, *args, **kwargs)
+
+
+_Registry.cursor = _registry_cursor
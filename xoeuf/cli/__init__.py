@@ -116,4 +116,6 @@ from . import migration
 from . import shell as _shell
 from . import secure as _secure
 from . import addons as _addons
-del _, _shell, _secure, _addons, migration
+from . import outbox as _outbox
+from . import sentrylog as _sentrylog
+del _, _shell, _secure, _addons, _outbox, _sentrylog, migration
@@ -283,6 +283,11 @@ class Mailgate(Command):
 
     def run(self, args=None):
         from xoeuf.sentrylog import patch_logging
+        try:
+            from xoeuf.sentrylog import report_slow_operation
+        except ImportError:
+            # The Sentry integration of Odoo doesn't report slow operations.
+            report_slow_operation = None
         patch_logging(force=True)
         parser = self.get_arg_parser()
         options = parser.parse_args(args)
@@ -303,6 +308,7 @@ class Mailgate(Command):
                            + message)
             retries = 0
             done = False
+            start = time.time()
             while not done:
                 try:
                     if Deferred and options.quick and random.random() < 0.1 and len(message) < MAX_SIZE_FOR_DEFERRED:  # noqa
@@ -324,6 +330,9 @@ class Mailgate(Command):
                         raise
                 else:
                     done = True
+            if report_slow_operation:
+                report_slow_operation('mailgate', options.database,
+                                      time.time() - start)
         except:
             import sys
             if options.defer:
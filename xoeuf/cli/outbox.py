@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# ---------------------------------------------------------------------
+# xoeuf.cli.outbox
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-12
+
+'''Deliver the signals stored in the outbox of a DB.
+
+See `xoeuf.signals.OutboxSignal`:class:.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+from . import Command
+
+
+class Outbox(Command):
+    '''Deliver the signals stored in the outbox of a DB.
+
+    Several instances may run for the same DB.  Any argument not recognized
+    is passed to Odoo's configuration (e.g ``--db_host``).
+
+    '''
+    @classmethod
+    def get_arg_parser(cls):
+        res = getattr(cls, '_arg_parser', None)
+        if not res:
+            from argparse import ArgumentParser
+            res = ArgumentParser()
+            cls._arg_parser = res
+            res.add_argument('-d', '--database', dest='database',
+                             required=True)
+            res.add_argument('--batch-size', dest='batch_size',
+                             default=100, type=int,
+                             help='How many signals to deliver per '
+                             'transaction.  Defaults to 100.')
+            res.add_argument('--max-attempts', dest='max_attempts',
+                             default=5, type=int,
+                             help='Stop retrying a signal after it failed '
+                             'this many times.  Defaults to 5.')
+            res.add_argument('--idle-time', dest='idle_time',
+                             default=1.0, type=float,
+                             help='How much time in seconds to wait when '
+                             'the outbox is empty.  Defaults to 1.')
+            res.add_argument('--once', dest='once',
+                             action='store_true',
+                             default=False,
+                             help='Exit once the outbox is empty.')
+        return res
+
+    @classmethod
+    def database_factory(cls, database):
+        try:
+            from odoo.modules.registry import Registry
+            get = Registry
+        except ImportError:
+            from openerp.modules.registry import RegistryManager
+            get = RegistryManager.get
+        return get(database)
+
+    def run(self, args=None):
+        import time
+        try:
+            from openerp.tools import config
+        except ImportError:
+            from odoo.tools import config
+        from xoeuf.signals import drain_outbox
+        parser = self.get_arg_parser()
+        options, odoo_args = parser.parse_known_args(args)
+        if odoo_args:
+            config.parse_config(odoo_args)
+        registry = self.database_factory(options.database)
+        while True:
+            with registry.cursor() as cr:
+                count = drain_outbox(cr, limit=options.batch_size,
+                                     max_attempts=options.max_attempts)
+            if not count:
+                if options.once:
+                    break
+                time.sleep(options.idle_time)
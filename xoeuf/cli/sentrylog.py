@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# ---------------------------------------------------------------------
+# xoeuf.cli.sentrylog
+# ---------------------------------------------------------------------
+# Copyright (c) 2017 Merchise Autrement [~º/~] and Contributors
+# All rights reserved.
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the LICENCE attached (see LICENCE file) in the distribution
+# package.
+#
+# Created on 2017-06-20
+
+'''Send the error events spooled by the 'spool' transport of sentrylog.
+
+See `xoeuf.sentrylog.replay_spool`:func:.
+
+'''
+
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+from . import Command
+
+
+class SentrylogReplay(Command):
+    '''Send the error events spooled by the 'spool' transport of sentrylog.
+
+    Events that can't be sent remain in the spool.  Exits with status 1 if
+    any event remains in the spool.
+
+    '''
+    command_cli_name = 'sentrylog-replay'
+
+    @classmethod
+    def get_arg_parser(cls):
+        res = getattr(cls, '_arg_parser', None)
+        if not res:
+            from argparse import ArgumentParser
+            res = ArgumentParser()
+            cls._arg_parser = res
+            res.add_argument('--spool-dir', dest='spool_dir',
+                             default=None,
+                             help='The spool directory.  Defaults to the '
+                             'default of the "sentrylog.spool-dir" '
+                             'configuration key.')
+            res.add_argument('--url', dest='url',
+                             default=None,
+                             help='Send all the events to this URL, instead '
+                             'of the one they were spooled with.  Useful to '
+                             'send them to a local stand-in of Sentry.')
+            res.add_argument('--timeout', dest='timeout',
+                             default=5, type=int,
+                             help='The timeout in seconds of each request.  '
+                             'Defaults to 5.')
+            res.add_argument('-q', '--quiet', dest='quiet',
+                             action='store_true',
+                             default=False,
+                             help='Don\'t print the number of events sent.')
+        return res
+
+    def run(self, args=None):
+        from xoeuf._sentrylog import replay_spool
+        parser = self.get_arg_parser()
+        options = parser.parse_args(args)
+        sent, left = replay_spool(options.spool_dir, url=options.url,
+                                  timeout=options.timeout)
+        if not options.quiet:
+            print('Sent %d events, %d left in the spool.' % (sent, left))
+        return 1 if left else 0
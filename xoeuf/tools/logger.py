@@ -13,8 +13,27 @@
 '''Initialize the OpenERP logger, and provides a function to smartly get a
 logger.
 
+Also provides a structured logging mode (see `init_structured_logger`:func:)
+which writes records as JSON lines from a background thread.
+
 '''
 
+from __future__ import (division as _py3_division,
+                        print_function as _py3_print,
+                        absolute_import as _py3_abs_import)
+
+import os
+import sys
+import copy
+import json
+import logging
+import threading
+
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
+
 try:
     from openerp.netsvc import init_logger
 except ImportError:
@@ -23,18 +42,282 @@ except ImportError:
 
 DEFAULT_LOGGER_NAME = str('xoeuf')
 
+# Loggers already requested with `get_logger`.
+_loggers = {}
+
 
 def get_logger(name=None):
     '''If a `name` is given, is normally getter, otherwise look for the upper
     module name.
 
+    Loggers are cached per name, so calling this function in hot paths is
+    cheap; still, prefer to get the logger once per module.
+
     '''
-    from logging import getLogger
     if not name:
-        import sys
         frame = sys._getframe(1)
         name = frame.f_globals.get('__name__', DEFAULT_LOGGER_NAME)
-    return getLogger(str(name))
+    try:
+        return _loggers[name]
+    except KeyError:
+        return _loggers.setdefault(name, logging.getLogger(str(name)))
+
+
+class ContextFilter(logging.Filter):
+    '''Add the Odoo context to the records.
+
+    Sets the attributes `dbname`, `uid` (from the current thread, as Odoo
+    sets them) and `request_id` of the records; None when unknown.  The
+    request id is taken from the header 'X-Request-Id', or generated once
+    per HTTP request.
+
+    '''
+    def filter(self, record):
+        thread = threading.current_thread()
+        record.dbname = getattr(thread, 'dbname', None)
+        record.uid = getattr(thread, 'uid', None)
+        record.request_id = _get_request_id()
+        return True
+
+
+_request = None
+
+
+def _get_request_id():
+    global _request
+    if _request is None:
+        try:
+            from openerp.http import request as _request
+        except ImportError:
+            from odoo.http import request as _request
+    try:
+        httprequest = getattr(_request, 'httprequest', None)
+    except RuntimeError:
+        # Not bound to a request.
+        return None
+    if httprequest is None:
+        return None
+    environ = httprequest.environ
+    result = environ.get('xoeuf.request_id')
+    if result is None:
+        result = environ.get('HTTP_X_REQUEST_ID')
+        if not result:
+            import uuid
+            result = uuid.uuid4().hex
+        environ['xoeuf.request_id'] = result
+    return result
+
+
+class JSONFormatter(logging.Formatter):
+    '''Format the records as JSON objects (one per line).
+
+    The keys are 'time', 'level', 'logger', 'message' and 'pid'; and
+    'dbname', 'uid' and 'request_id' if known (see `ContextFilter`:class:),
+    and 'exc' with the traceback if any.
+
+    '''
+    CONTEXT_KEYS = ('dbname', 'uid', 'request_id')
+
+    def format(self, record):
+        result = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key in self.CONTEXT_KEYS:
+            value = getattr(record, key, None)
+            if value is not None:
+                result[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            result['exc'] = record.exc_text
+        try:
+            return json.dumps(result, default=repr)
+        except UnicodeDecodeError:
+            # Python 2 byte strings which are not UTF-8.
+            result = {key: _decode(value) for key, value in result.items()}
+            return json.dumps(result, default=repr)
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    else:
+        return value
+
+
+try:
+    from logging.handlers import QueueHandler as _QueueHandler, QueueListener
+except ImportError:
+    # Python 2.  Simplified versions of the ones in Python 3.
+    class _QueueHandler(logging.Handler):
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def enqueue(self, record):
+            self.queue.put_nowait(record)
+
+        def prepare(self, record):
+            self.format(record)
+            record.msg = record.message
+            record.args = None
+            record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.enqueue(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        '''Handle the records of a queue in a background thread.'''
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self._thread = None
+            self.respect_handler_level = kwargs.get('respect_handler_level',
+                                                    False)
+
+        def dequeue(self, block):
+            return self.queue.get(block)
+
+        def start(self):
+            self._thread = thread = threading.Thread(target=self._monitor)
+            thread.daemon = True
+            thread.start()
+
+        def prepare(self, record):
+            return record
+
+        def handle(self, record):
+            record = self.prepare(record)
+            for handler in self.handlers:
+                if not self.respect_handler_level:
+                    process = True
+                else:
+                    process = record.levelno >= handler.level
+                if process:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.dequeue(True)
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def enqueue_sentinel(self):
+            self.queue.put_nowait(self._sentinel)
+
+        def stop(self):
+            self.enqueue_sentinel()
+            self._thread.join()
+            self._thread = None
+
+
+class QueueHandler(_QueueHandler):
+    '''Put the records in a bounded queue to be handled by a
+    `QueueListener`.
+
+    Unlike the standard one: records are copied (other handlers still see
+    the original); the traceback is kept in `exc_text` apart from the
+    message; and records are dropped (and counted in `dropped`) if the queue
+    is full, instead of blocking.
+
+    If the process forks (e.g prefork workers) the `listener`, if given, is
+    restarted with a new queue in the child process.
+
+    '''
+    def __init__(self, queue, listener=None):
+        super(QueueHandler, self).__init__(queue)
+        self.listener = listener
+        self.dropped = 0
+        self._pid = os.getpid()
+        self._fork_lock = threading.Lock()
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exc_formatter.formatException(
+                record.exc_info
+            )
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        listener = self.listener
+        if listener is not None and self._pid != os.getpid():
+            self._restart(listener)
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def _restart(self, listener):
+        # Threads don't survive a fork.  Several threads of the child may
+        # log at once, only one must start the listener.
+        with self._fork_lock:
+            pid = os.getpid()
+            if self._pid != pid:
+                self.queue = listener.queue = Queue(self.queue.maxsize)
+                listener._thread = None
+                listener.start()
+                self._pid = pid
+
+
+def init_structured_logger(filename=None, level=None, queue_size=10000):
+    '''Make the root logger write JSON lines from a background thread.
+
+    Replaces the handlers of the root logger by a `QueueHandler`:class:
+    (with a `ContextFilter`:class:), whose records are written by a
+    `QueueListener` with a `JSONFormatter`:class: to the file `filename` (or
+    the standard error).  So, neither the formatting nor the latency of the
+    disk block the threads that log.
+
+    :param level: If given, the level of the root logger.
+
+    :param queue_size: How many records may wait to be written.  Records
+           logged when the queue is full are dropped.
+
+    Return the listener (already started).
+
+    '''
+    if filename:
+        from logging.handlers import WatchedFileHandler
+        target = WatchedFileHandler(filename)
+    else:
+        target = logging.StreamHandler()
+    target.setFormatter(JSONFormatter())
+    queue = Queue(queue_size)
+    listener = QueueListener(queue, target)
+    handler = QueueHandler(queue, listener)
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    if level is not None:
+        root.setLevel(level)
+    listener.start()
+    import atexit
+    atexit.register(_stop_listener, handler)
+    return listener
+
+
+def _stop_listener(handler):
+    # Only the process that started the thread may wait for it.
+    listener = handler.listener
+    if handler._pid == os.getpid() and listener._thread is not None:
+        listener.stop()
 
 
 init_logger()